@@ -0,0 +1,129 @@
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+# Build-time knob: postings kept per term, highest weights first. Common
+# terms lose their weakest postings, which rarely decide a top list.
+ANN_POSTINGS_PER_TERM = 1000
+# Query-time knobs: the query's heaviest terms that are looked up, and how
+# many of the best partial scores are rescored exactly
+ANN_QUERY_TERMS = int(os.environ.get('CINEMATCH_ANN_QUERY_TERMS', 16))
+ANN_CANDIDATES = int(os.environ.get('CINEMATCH_ANN_CANDIDATES', 200))
+
+def row_ranks(matrix):
+    # Rank of each stored entry of a CSR matrix within its row, 0 for the
+    # largest. Ties go to the lower column, as in a stable sort of the row.
+    lengths = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], lengths)
+    return ranks
+
+def top_entries(matrix, n):
+    # The n largest stored entries of each row of a sparse matrix, ties at
+    # the cut going to the lower columns. The rows are laid side by side in
+    # a dense block padded with -inf, so one partial selection finds every
+    # row's cut; a row of candidates holds at most query_terms *
+    # postings_per_term entries, which bounds the block.
+    matrix = sparse.csr_matrix(matrix)
+    lengths = np.diff(matrix.indptr)
+    if lengths.max(initial=0) <= n:
+        return matrix
+    num_rows, width = matrix.shape[0], lengths.max()
+    owners = np.repeat(np.arange(num_rows), lengths)
+    if num_rows == 1:
+        padded = matrix.data[None]
+    else:
+        padded = np.full((num_rows, width), -np.inf)
+        padded[owners, np.arange(matrix.nnz) - matrix.indptr[owners]] = matrix.data
+    cut = np.partition(padded, width - n, axis=1)[:, width - n][owners]
+
+    keep = matrix.data > cut
+    room = n - np.bincount(owners[keep], minlength=num_rows)
+    # Entries tied at the cut fill what is left; only when there are more
+    # of them than room are they taken by row and then column
+    tied = np.flatnonzero(matrix.data == cut)
+    if (np.bincount(owners[tied], minlength=num_rows) > room).any():
+        tied = tied[np.lexsort((matrix.indices[tied], owners[tied]))]
+        tied_owners = owners[tied]
+        tied = tied[np.arange(len(tied)) - np.searchsorted(tied_owners, tied_owners) < room[tied_owners]]
+    keep[tied] = True
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(owners[keep], minlength=num_rows))])
+    return sparse.csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+class ImpactIndex:
+    # Approximate search over the TF-IDF rows with impact-ordered, truncated
+    # postings. A query only walks the postings of its heaviest terms, each
+    # capped at postings_per_term, so its cost is bounded by
+    # query_terms * postings_per_term however large the catalog grows. The
+    # movies with the best partial scores are then rescored exactly.
+
+    def __init__(self, postings_per_term=ANN_POSTINGS_PER_TERM):
+        if postings_per_term < 1:
+            raise ValueError("postings_per_term must be at least 1")
+        self.postings_per_term = postings_per_term
+        self.postings = None
+
+    def fit(self, inverted_index):
+        # Keeps the postings_per_term heaviest movies of every term row of
+        # the terms x movies postings matrix
+        inverted_index = sparse.csr_matrix(inverted_index)
+        num_terms = inverted_index.shape[0]
+        lengths = np.diff(inverted_index.indptr)
+        terms = np.repeat(np.arange(num_terms), lengths)
+        order = np.lexsort((-inverted_index.data, terms))
+        rank = np.arange(len(order)) - np.repeat(inverted_index.indptr[:-1], lengths)
+        keep = np.sort(order[rank < self.postings_per_term])
+
+        postings = sparse.csr_matrix(
+            (inverted_index.data[keep], inverted_index.indices[keep],
+             np.concatenate([[0], np.cumsum(np.minimum(lengths, self.postings_per_term))])),
+            shape=inverted_index.shape
+        )
+        postings.sort_indices()
+        self.postings = postings
+        return self
+
+    def candidates(self, queries, query_terms=ANN_QUERY_TERMS, max_candidates=ANN_CANDIDATES):
+        # Partial scores of the best candidates for each row of the
+        # queries x terms matrix, as a sparse queries x movies matrix
+        queries = top_entries(queries, query_terms)
+        return top_entries(queries @ self.postings, max_candidates)
+
+    def score_candidates(self, feature_vectors, queries, query_terms=ANN_QUERY_TERMS, max_candidates=ANN_CANDIDATES):
+        # Exact cosine scores for each query's candidates only, as a sparse
+        # queries x movies matrix that top_k_matches() can rank like the
+        # exact path. A block of queries is scored with one elementwise
+        # product of the candidates' rows with their query's.
+        queries = sparse.csr_matrix(queries)
+        candidates = self.candidates(queries, query_terms, max_candidates)
+        owners = np.repeat(np.arange(queries.shape[0]), np.diff(candidates.indptr))
+        scores = np.asarray(
+            feature_vectors[candidates.indices].multiply(queries[owners]).sum(axis=1)
+        ).ravel()
+        return sparse.csr_matrix(
+            (scores, candidates.indices, candidates.indptr), shape=(queries.shape[0], feature_vectors.shape[0])
+        )
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for part in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(directory, f"ann_postings_{part}.npy"), getattr(self.postings, part))
+        with open(os.path.join(directory, "ann.json"), "w") as f:
+            json.dump({'postings_per_term': self.postings_per_term, 'shape': list(self.postings.shape)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, "ann.json")) as f:
+            params = json.load(f)
+        index = cls(params['postings_per_term'])
+        parts = [
+            np.load(os.path.join(directory, f"ann_postings_{part}.npy"), mmap_mode=mmap_mode)
+            for part in ('data', 'indices', 'indptr')
+        ]
+        index.postings = sparse.csr_matrix(tuple(parts), shape=tuple(params['shape']), copy=False)
+        return index
@@ -0,0 +1,127 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+from engine import CATALOG_PATH, MODEL_DIR, SIMILARITY_BLOCK_ROWS, load_model, recommend_many, resolve_titles
+
+# Offline "more like this" lists, for the whole catalog or a file of seed
+# titles (one per line):
+#   python batch.py --all --k 20 --out more_like_this.parquet
+#   python batch.py --seeds daily_seeds.txt --out daily.csv
+
+OUTPUT_COLUMNS = ['seed', 'seed_title', 'rank', 'title', 'similarity_score']
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(OUTPUT_COLUMNS)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*(columns[name] for name in OUTPUT_COLUMNS)))
+
+    def close(self):
+        self.file.close()
+
+class ParquetSink:
+    # One row group per block, so the whole output is never held in memory
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or write a .csv instead.")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('seed', pa.string()),
+            ('seed_title', pa.string()),
+            ('rank', pa.int16()),
+            ('title', pa.string()),
+            ('similarity_score', pa.float32())
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns):
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def open_sink(path):
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        return ParquetSink(path)
+    return CsvSink(path)
+
+def read_seeds(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def run_batch(movies_data, similarity, seeds, rows, sink, k, workers, block_rows):
+    # Streams the recommendation lists for rows (one per seed) into sink
+    titles = movies_data['title'].to_numpy()
+    seed_for_row = dict(zip(rows.tolist(), seeds))
+    written = 0
+
+    for block, neighbor_ids, neighbor_scores in recommend_many(similarity, rows, k, workers, block_rows):
+        per_row = neighbor_ids.shape[1]
+        block_seeds = np.array([seed_for_row[row] for row in block.tolist()], dtype=object)
+        sink.write({
+            'seed': np.repeat(block_seeds, per_row).tolist(),
+            'seed_title': np.repeat(titles[block], per_row).tolist(),
+            'rank': np.tile(np.arange(1, per_row + 1), len(block)).tolist(),
+            'title': titles[neighbor_ids.ravel()].tolist(),
+            'similarity_score': neighbor_scores.ravel().astype(float).tolist()
+        })
+        written += len(block)
+
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute recommendation lists for many titles at once.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--all', action='store_true', help="every title in the catalog")
+    source.add_argument('--seeds', help="text file with one seed title per line")
+    parser.add_argument('--out', required=True, help="output .csv or .parquet file")
+    parser.add_argument('--k', type=int, default=10, help="recommendations per seed")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--block-rows', type=int, default=SIMILARITY_BLOCK_ROWS)
+    parser.add_argument('--model', default=MODEL_DIR)
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    movies_data, similarity = load_model(args.model, args.catalog)
+
+    if args.all:
+        rows = np.arange(len(movies_data))
+        seeds = movies_data['title'].tolist()
+    else:
+        seeds = read_seeds(args.seeds)
+        rows = resolve_titles(similarity['title_index'], seeds)
+        unresolved = [seed for seed, row in zip(seeds, rows) if row < 0]
+        for seed in unresolved:
+            print(f"No match for seed {seed!r}", file=sys.stderr)
+        # Seeds resolving to the same movie are written once
+        keep = {}
+        for seed, row in zip(seeds, rows.tolist()):
+            if row >= 0:
+                keep.setdefault(row, seed)
+        rows = np.array(list(keep), dtype=np.int64)
+        seeds = list(keep.values())
+
+    sink = open_sink(args.out)
+    try:
+        written = run_batch(movies_data, similarity, seeds, rows, sink, args.k, args.workers, args.block_rows)
+    finally:
+        sink.close()
+
+    print(f"Wrote {args.k} recommendations for {written} seeds to {args.out} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1166 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import metrics
+from ann import ANN_POSTINGS_PER_TERM, ImpactIndex, row_ranks
+from facets import FacetIndex
+from title_index import PrefixIndex, ResolutionCache, TitleIndex
+
+# A .parquet or .feather catalog (see `engine.py convert`) is read column by
+# column; anything else is parsed as CSV
+CATALOG_PATH = os.environ.get('CINEMATCH_CATALOG', 'movies_preprocessed.csv')
+MODEL_DIR = 'model'
+# Times load_model() follows model_dir to a newer version when the one it
+# was mapping is retired by a build
+LOAD_ATTEMPTS = 3
+# Bump whenever the layout of the files written by save_model() changes
+ARTIFACT_VERSION = 8
+
+# Each field is vectorized into its own unit-length TF-IDF block. Two
+# movies' similarity is the cosine of their rows with every block scaled by
+# the square root of its field's weight: the weighted mean of their
+# per-field cosines when both have every field, and still 1 for a movie
+# and itself when some of its fields are empty.
+SELECTED_FEATURES = ['genres', 'keywords', 'tagline', 'cast', 'director']
+# Weights the neighbor index is built with (`engine.py build --field-weights`)
+DEFAULT_FIELD_WEIGHTS = {feature: 1.0 for feature in SELECTED_FEATURES}
+# Serving weights, e.g. "director=2,tagline=0.5"; fields left out keep the
+# weights of the build. Requests that differ from the build are scored
+# against the whole catalog instead of read from the neighbor index.
+FIELD_WEIGHTS = os.environ.get('CINEMATCH_FIELD_WEIGHTS', '')
+# Distinct sets of request weights whose term multipliers are kept
+WEIGHT_CACHE_SIZE = 64
+# Columns recommendations can be filtered on, besides the genres
+FACET_COLUMNS = ['release_date', 'original_language']
+# The only catalog columns the model is built from; the overview, content and
+# title_lower columns written by data_process.ipynb are never read
+CATALOG_COLUMNS = ['title', 'popularity'] + SELECTED_FEATURES + FACET_COLUMNS
+# Catalog columns with few distinct values, read as categoricals
+CATEGORICAL_COLUMNS = ['genres', 'director', 'original_language']
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+
+# Neighbors kept per movie in the similarity index. Recommendation counts up
+# to this are served straight from the index.
+NEIGHBOR_K = 50
+# Rows of the similarity matrix materialized at a time while building the index
+SIMILARITY_BLOCK_ROWS = 1024
+# Rows whose ANN candidates are gathered and scored together in an ANN build
+ANN_BLOCK_ROWS = 256
+# Ceiling on the memory the neighbor index build spends on similarity blocks,
+# summed over its worker processes; blocks shrink to fit under it
+BUILD_MEMORY_MB = int(os.environ.get('CINEMATCH_BUILD_MEMORY_MB', 1024))
+# Working memory per similarity cell: the dense block, the partitioned copy,
+# the selection mask and the sparse product of the rare terms
+BLOCK_BYTES_PER_CELL = 32
+# Terms in more than this share of the movies (genres, prolific actors) are
+# scored with a dense matrix product; the rest stay sparse
+COMMON_TERM_SHARE = 0.01
+# How strongly a disliked movie pushes a profile away, relative to a liked one
+DISLIKE_WEIGHT = 0.5
+# Most popular titles put in the resolution cache when a model is loaded
+WARM_TITLES = 1000
+# 'exact' scores every movie sharing a term with the query; 'ann' rescores
+# only the candidates from the approximate index (needs a build with
+# --engine ann). Unset means whatever the artifact was built for.
+SEARCH_ENGINE = os.environ.get('CINEMATCH_ENGINE')
+# `engine.py update` falls back to a full rebuild once the tokens it had to
+# drop as out of vocabulary since the last build pass this share of the
+# tokens that vocabulary was fitted on
+VOCABULARY_DRIFT_THRESHOLD = 0.02
+
+class ArtifactError(Exception):
+    pass
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def top_k_indices(scores, k):
+    # Positions of the k highest scores, best first. Ties keep catalog order,
+    # matching a stable sort of the whole row.
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= threshold)
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order[:k]]
+
+class SimilarityBlocks:
+    # Dense blocks of rows of the cosine similarity matrix. The TF-IDF rows
+    # are already L2 normalized, so that is their product. A handful of
+    # common terms make that product mostly nonzero, which a sparse product
+    # computes slowly, so those terms are kept as a dense slab for BLAS and
+    # only the rare terms go through the sparse product.
+    def __init__(self, feature_vectors, max_dense_bytes=None):
+        num_movies = feature_vectors.shape[0]
+        document_frequency = np.bincount(feature_vectors.indices, minlength=feature_vectors.shape[1])
+        common = np.flatnonzero(document_frequency > COMMON_TERM_SHARE * num_movies)
+        if max_dense_bytes is not None:
+            max_terms = int(max_dense_bytes // (num_movies * 8))
+            common = common[np.argsort(-document_frequency[common], kind='stable')[:max_terms]]
+        rare = np.setdiff1d(np.arange(feature_vectors.shape[1]), common)
+        self.num_movies = num_movies
+        self.common = feature_vectors[:, common].toarray()
+        self.rare = feature_vectors[:, rare].tocsr()
+        self.rare_transposed = self.rare.T.tocsr()
+
+    @property
+    def nbytes(self):
+        return self.common.nbytes + sum(
+            array.nbytes for matrix in (self.rare, self.rare_transposed)
+            for array in (matrix.data, matrix.indices, matrix.indptr)
+        )
+
+    def block(self, rows):
+        block = self.common[rows] @ self.common.T
+        rare = self.rare[rows] @ self.rare_transposed
+        block[np.repeat(np.arange(len(rows)), np.diff(rare.indptr)), rare.indices] += rare.data
+        return block
+
+def parse_field_weights(text):
+    # {field: weight} from "director=2,tagline=0.5"
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        field, _, value = item.partition('=')
+        field = field.strip()
+        if field not in SELECTED_FEATURES:
+            raise ValueError(f"Unknown field '{field}', use one of {', '.join(SELECTED_FEATURES)}.")
+        try:
+            weight = float(value)
+        except ValueError:
+            raise ValueError(f"The weight of '{field}' must be a number, got '{value.strip()}'.")
+        if not 0 <= weight < float('inf'):
+            raise ValueError(f"The weight of '{field}' must be zero or more.")
+        weights[field] = weight
+    return weights
+
+def column_weights(field_offsets, weights):
+    # Per-term multipliers: every term's field weight. weights are in field
+    # order.
+    return np.repeat(np.asarray(weights, dtype=np.float64), np.diff(field_offsets))
+
+def field_presence(vectors, field_offsets):
+    # rows x fields mask of the field blocks each row has terms in
+    vectors = sparse.csr_matrix(vectors)
+    fields = np.searchsorted(field_offsets, vectors.indices, side='right') - 1
+    present = np.zeros((vectors.shape[0], len(field_offsets) - 1), dtype=bool)
+    present[np.repeat(np.arange(vectors.shape[0]), np.diff(vectors.indptr)), fields] = True
+    return present
+
+def inverse_lengths(present, weights):
+    # 1 / length of each row once its unit-length field blocks are scaled by
+    # the square root of their weights, 0 for rows left empty
+    lengths = np.sqrt(present @ np.asarray(weights, dtype=np.float64))
+    return np.divide(1.0, lengths, out=np.zeros_like(lengths), where=lengths > 0)
+
+def weigh_terms(vectors, multipliers):
+    # vectors with every stored term scaled by its multiplier
+    vectors = sparse.csr_matrix(vectors)
+    return sparse.csr_matrix(
+        (vectors.data * multipliers[vectors.indices], vectors.indices, vectors.indptr), shape=vectors.shape
+    )
+
+def index_vectors(feature_vectors, field_offsets, weights):
+    # Unit-length rows whose plain dot products are the weighted
+    # similarities, for the blocked all-pairs products of the neighbor index
+    scaled = weigh_terms(feature_vectors, np.sqrt(column_weights(field_offsets, weights)))
+    row_scale = inverse_lengths(field_presence(feature_vectors, field_offsets), weights)
+    return (sparse.diags(row_scale) @ scaled).tocsr()
+
+def normalize_fields(vectors, field_offsets):
+    # Scales every field block of every row to unit length, as the TF-IDF
+    # fit leaves them; empty blocks stay empty
+    vectors = sparse.csr_matrix(vectors, copy=True)
+    num_fields = len(field_offsets) - 1
+    fields = np.searchsorted(field_offsets, vectors.indices, side='right') - 1
+    groups = np.repeat(np.arange(vectors.shape[0]), np.diff(vectors.indptr)) * num_fields + fields
+    norms = np.sqrt(np.bincount(groups, weights=vectors.data ** 2, minlength=vectors.shape[0] * num_fields))
+    vectors.data = np.divide(vectors.data, norms[groups], out=np.zeros_like(vectors.data), where=norms[groups] > 0)
+    vectors.eliminate_zeros()
+    return vectors
+
+def block_top_k(blocks, rows, width):
+    # Neighbor lists for a block of rows. Scores are ranked as the float32
+    # they are stored as, like top_k_matches() does, so rounding noise can't
+    # order exact ties differently from the query path.
+    block = blocks.block(rows).astype(np.float32)
+    num_movies = block.shape[1]
+    neighbor_ids = np.empty((len(rows), width), dtype=np.int32)
+    neighbor_scores = np.empty((len(rows), width), dtype=np.float32)
+    if width >= num_movies:
+        order = np.argsort(-block, axis=1, kind='stable')
+        return order.astype(np.int32), np.take_along_axis(block, order, axis=1).astype(np.float32)
+
+    # One partial selection for the whole block finds every row's width-th
+    # best score. Rows with exactly width scores at or above it are sorted
+    # together; the few with ties at that score go through top_k_indices.
+    threshold = np.partition(block, num_movies - width, axis=1)[:, num_movies - width]
+    selected = block >= threshold[:, None]
+    untied = selected.sum(axis=1) == width
+    if untied.any():
+        # Column positions come out in catalog order, so the stable sort
+        # breaks ties the same way top_k_indices does
+        ids = np.nonzero(selected[untied])[1].reshape(-1, width)
+        scores = block[np.flatnonzero(untied)[:, None], ids]
+        order = np.argsort(-scores, axis=1, kind='stable')
+        neighbor_ids[untied] = np.take_along_axis(ids, order, axis=1)
+        neighbor_scores[untied] = np.take_along_axis(scores, order, axis=1)
+    for offset in np.flatnonzero(~untied):
+        top = top_k_indices(block[offset], width)
+        neighbor_ids[offset] = top
+        neighbor_scores[offset] = block[offset, top]
+    return neighbor_ids, neighbor_scores
+
+def block_rows_for(blocks, workers=1, memory_mb=BUILD_MEMORY_MB):
+    # Largest block that keeps every worker's similarity block, plus the copy
+    # of the term matrices each worker process holds, under memory_mb
+    budget = memory_mb * (1 << 20) / workers
+    if workers > 1:
+        budget -= blocks.nbytes
+    block_rows = int(budget // (blocks.num_movies * BLOCK_BYTES_PER_CELL))
+    return max(1, min(block_rows, SIMILARITY_BLOCK_ROWS))
+
+_worker_blocks = None
+
+def _init_block_worker(blocks):
+    global _worker_blocks
+    _worker_blocks = blocks
+
+def _block_top_k_worker(rows, width):
+    return block_top_k(_worker_blocks, rows, width)
+
+def iter_neighbor_blocks(feature_vectors, rows, width, block_rows=SIMILARITY_BLOCK_ROWS, workers=1):
+    # Yields (rows, neighbor_ids, neighbor_scores) for consecutive blocks of
+    # rows, in order. feature_vectors may already be SimilarityBlocks. With
+    # workers > 1 the blocks are spread over a process pool; at most two
+    # blocks per worker are in flight, so memory stays bounded however
+    # slowly the caller consumes the results.
+    blocks = feature_vectors
+    if not isinstance(blocks, SimilarityBlocks):
+        blocks = SimilarityBlocks(feature_vectors)
+    rows = np.asarray(rows)
+    batches = [rows[start:start + block_rows] for start in range(0, len(rows), block_rows)]
+    if workers <= 1:
+        for batch in batches:
+            yield (batch, *block_top_k(blocks, batch, width))
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_block_worker, initargs=(blocks,)) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, pool.submit(_block_top_k_worker, batch, width)))
+            if len(in_flight) >= 2 * workers:
+                done_batch, future = in_flight.popleft()
+                yield (done_batch, *future.result())
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            yield (done_batch, *future.result())
+
+def build_neighbor_index(feature_vectors, k=NEIGHBOR_K, workers=1, memory_mb=BUILD_MEMORY_MB):
+    # Each row holds the movie's k+1 closest titles (normally itself first).
+    # Only a block of the similarity matrix per worker is ever in memory,
+    # sized so the blocks and the dense slab of common terms (at most a
+    # quarter of the ceiling) fit under memory_mb.
+    num_movies = feature_vectors.shape[0]
+    width = min(k + 1, num_movies)
+    neighbor_ids = np.empty((num_movies, width), dtype=np.int32)
+    neighbor_scores = np.empty((num_movies, width), dtype=np.float32)
+
+    blocks = SimilarityBlocks(feature_vectors, memory_mb * (1 << 20) / (4 * max(workers, 1)))
+    block_rows = block_rows_for(blocks, workers, memory_mb)
+    for rows, block_ids, block_scores in iter_neighbor_blocks(
+        blocks, np.arange(num_movies), width, block_rows, workers
+    ):
+        neighbor_ids[rows] = block_ids
+        neighbor_scores[rows] = block_scores
+
+    return neighbor_ids, neighbor_scores
+
+def build_ann_neighbor_index(feature_vectors, ann, field_offsets, weights, k=NEIGHBOR_K,
+                             block_rows=ANN_BLOCK_ROWS):
+    # Approximate neighbor lists from the ANN candidates, for catalogs where
+    # the exact all-pairs build is too slow. weights are the build's, in
+    # field order. Candidates are gathered and scored a block of rows at a
+    # time.
+    num_movies = feature_vectors.shape[0]
+    width = min(k + 1, num_movies)
+    neighbor_ids = np.empty((num_movies, width), dtype=np.int32)
+    neighbor_scores = np.empty((num_movies, width), dtype=np.float32)
+
+    vectors = index_vectors(feature_vectors, field_offsets, weights)
+    for start in range(0, num_movies, block_rows):
+        rows = np.arange(start, min(start + block_rows, num_movies))
+        neighbor_ids[rows], neighbor_scores[rows] = top_k_rows(ann.score_candidates(vectors, vectors[rows]), width)
+
+    return neighbor_ids, neighbor_scores
+
+def top_k_rows(matches, k):
+    # top_k_matches() for every row of a sparse score matrix at once. Rows
+    # with fewer than k positive scores need filler and go through it one
+    # by one.
+    matches = sparse.csr_matrix(matches)
+    data = matches.data.astype(np.float32)
+    positive = sparse.csr_matrix((np.where(data > 0, data, 0), matches.indices, matches.indptr), shape=matches.shape)
+    positive.eliminate_zeros()
+    lengths = np.diff(positive.indptr)
+    owners = np.repeat(np.arange(positive.shape[0]), lengths)
+    ranks = row_ranks(positive)
+    top = (ranks < k) & (lengths >= k)[owners]
+
+    neighbor_ids = np.empty((matches.shape[0], k), dtype=np.int32)
+    neighbor_scores = np.empty((matches.shape[0], k), dtype=np.float32)
+    neighbor_ids[owners[top], ranks[top]] = positive.indices[top]
+    neighbor_scores[owners[top], ranks[top]] = positive.data[top]
+    for row in np.flatnonzero(lengths < k):
+        neighbor_ids[row], neighbor_scores[row] = top_k_matches(matches[row], k)
+    return neighbor_ids, neighbor_scores
+
+def top_k_matches(matches, k, exclude=(), allowed=None):
+    # The k best (ids, scores) of a 1 x num_movies sparse score row. Movies
+    # without a positive score rank as 0 and fill up short lists in catalog
+    # order; excluded movies never appear, and with an allowed mask (see
+    # facet_mask()) neither do the movies it leaves out. Scores are ranked
+    # as float32, as the neighbor index stores them, so ties rank the same
+    # on both paths.
+    matches = matches.tocsr()
+    matches.sort_indices()
+    num_movies = matches.shape[1]
+    exclude = np.unique(np.asarray(exclude, dtype=matches.indices.dtype))
+    data = matches.data.astype(np.float32)
+    keep = (data > 0) & ~np.isin(matches.indices, exclude)
+    if allowed is not None:
+        keep &= allowed[matches.indices]
+        k = min(k, int(np.count_nonzero(allowed)) - int(np.count_nonzero(allowed[exclude])))
+    ids, scores = matches.indices[keep], data[keep]
+    k = min(k, num_movies - len(exclude))
+    top = top_k_indices(scores, k)
+    ids, scores = ids[top], scores[top]
+
+    missing = k - len(ids)
+    if missing > 0:
+        # Movies dropped for a score of 0 or below fill in like unscored ones
+        taken = np.union1d(ids, exclude)
+        if allowed is None:
+            filler = np.setdiff1d(np.arange(min(num_movies, len(taken) + missing)), taken)[:missing]
+        else:
+            filler = np.setdiff1d(np.flatnonzero(allowed), taken)[:missing]
+        ids = np.concatenate([ids, filler])
+        scores = np.concatenate([scores, np.zeros(len(filler), dtype=scores.dtype)])
+
+    return ids, scores
+
+def field_weights(similarity, overrides=None):
+    # The model's serving weights with a request's overrides applied
+    weights = dict(similarity['field_weights'])
+    weights.update(overrides or {})
+    if not sum(weights.values()) > 0:
+        raise ValueError("At least one field weight must be above zero.")
+    return weights
+
+def weighting(similarity, weights):
+    # (term multipliers, inverse catalog row lengths) for weights, cached per
+    # distinct set of weights. Which fields every movie has is worked out
+    # on first use.
+    key = tuple(weights[field] for field in similarity['fields'])
+    cached = similarity['column_weights'].get(key)
+    if cached is None:
+        if similarity.get('field_presence') is None:
+            similarity['field_presence'] = field_presence(similarity['feature_vectors'], similarity['field_offsets'])
+        if len(similarity['column_weights']) >= WEIGHT_CACHE_SIZE:
+            similarity['column_weights'].clear()
+        cached = similarity['column_weights'][key] = (
+            column_weights(similarity['field_offsets'], key), inverse_lengths(similarity['field_presence'], key)
+        )
+    return cached
+
+def weigh_query(similarity, query, weights):
+    # The query with its terms scaled by their field weights and the row by
+    # its own inverse length, so its dot product with a catalog row, times
+    # that row's inverse length, is their weighted similarity
+    multipliers, _ = weighting(similarity, weights)
+    query = sparse.csr_matrix(query)
+    fields = np.unique(np.searchsorted(similarity['field_offsets'], query.indices, side='right') - 1)
+    length = np.sqrt(sum(weights[similarity['fields'][field]] for field in fields))
+    data = query.data * multipliers[query.indices] / length if length > 0 else np.zeros_like(query.data)
+    return sparse.csr_matrix((data, query.indices, query.indptr), shape=query.shape)
+
+def score_catalog(similarity, query, weights):
+    # Sparse 1 x movies weighted similarities of a 1 x terms query made of
+    # unit-length field blocks, like a catalog row
+    _, catalog_scale = weighting(similarity, weights)
+    query = weigh_query(similarity, query, weights)
+    if similarity.get('engine') == 'ann':
+        scores = similarity['ann'].score_candidates(similarity['feature_vectors'], query)
+    else:
+        scores = sparse.csr_matrix(query @ similarity['inverted_index'])
+    scores.data *= catalog_scale[scores.indices]
+    return scores
+
+def query_similar(similarity, movie_index, k, weights=None, allowed=None, exclude=()):
+    # Scores one movie against the catalog with a single sparse row product
+    # over the term -> movie postings, so only movies sharing a term are
+    # touched, then keeps the k best the same way the neighbor index does.
+    weights = weights or field_weights(similarity)
+    query = similarity['feature_vectors'][movie_index]
+    return top_k_matches(score_catalog(similarity, query, weights), k, exclude, allowed)
+
+def facet_mask(similarity, filters=None):
+    # Boolean mask of the movies passing filters, a dict of FacetIndex.mask()
+    # arguments ({'genres': ['Comedy'], 'min_year': 2000}); None without any
+    if not filters:
+        return None
+    return similarity['facets'].mask(**filters)
+
+def profile_vector(similarity, liked_rows, disliked_rows=(), dislike_weight=DISLIKE_WEIGHT):
+    # Sum of the liked movies' vectors minus the weighted disliked ones, built
+    # as one sparse (1 x movies) @ (movies x terms) product, with each field
+    # block scaled back to unit length like a single movie's
+    feature_vectors = similarity['feature_vectors']
+    rows = np.concatenate([np.asarray(liked_rows, dtype=np.int64), np.asarray(disliked_rows, dtype=np.int64)])
+    weights = np.concatenate([np.ones(len(liked_rows)), np.full(len(disliked_rows), -dislike_weight)])
+    coefficients = sparse.csr_matrix(
+        (weights, (np.zeros(len(rows), dtype=np.int64), rows)),
+        shape=(1, feature_vectors.shape[0])
+    )
+    return normalize_fields(coefficients @ feature_vectors, similarity['field_offsets'])
+
+def recommendation_list(similarity, neighbor_ids, neighbor_scores):
+    titles = similarity['title_index'].titles.take(neighbor_ids)
+    return [
+        {
+            'title': title,
+            'similarity_score': float(score),
+            'rank': i + 1
+        }
+        for i, (title, score) in enumerate(zip(titles, neighbor_scores))
+    ]
+
+def recommend(movies_data, similarity, movie_index, num_recommendations=10, weights=None, filters=None):
+    # The movie itself is left out by id: an identical movie earlier in the
+    # catalog ties with it and can rank first. weights overrides some field
+    # weights for this call only; filters keeps only the movies passing them
+    # (see facet_mask()).
+    with metrics.stage('rank'):
+        weights = field_weights(similarity, weights)
+        allowed = facet_mask(similarity, filters)
+        if (num_recommendations < similarity['neighbor_ids'].shape[1]
+                and weights == similarity['index_weights']):
+            neighbor_ids = similarity['neighbor_ids'][movie_index]
+            neighbor_scores = similarity['neighbor_scores'][movie_index]
+            passing = neighbor_ids != movie_index
+            if allowed is not None:
+                passing &= allowed[neighbor_ids]
+            neighbor_ids = neighbor_ids[passing][:num_recommendations]
+            neighbor_scores = neighbor_scores[passing][:num_recommendations]
+            # A filter can leave too few scored neighbors in the list, and
+            # only scoring the whole catalog under the mask finds the rest
+            if len(neighbor_ids) == num_recommendations and (allowed is None or neighbor_scores[-1] > 0):
+                return recommendation_list(similarity, neighbor_ids, neighbor_scores)
+
+        neighbor_ids, neighbor_scores = query_similar(
+            similarity, movie_index, num_recommendations, weights, allowed, exclude=[movie_index]
+        )
+        return recommendation_list(similarity, neighbor_ids, neighbor_scores)
+
+def recommend_for_profile(movies_data, similarity, liked_rows, disliked_rows=(), num_recommendations=10,
+                          dislike_weight=DISLIKE_WEIGHT, weights=None, filters=None):
+    # One sparse matrix-vector product for the whole profile; the seed movies
+    # themselves are never recommended, nor movies failing filters
+    with metrics.stage('rank_profile'):
+        profile = profile_vector(similarity, liked_rows, disliked_rows, dislike_weight)
+        scores = score_catalog(similarity, profile, field_weights(similarity, weights))
+        seeds = np.concatenate([np.asarray(liked_rows, dtype=np.int64), np.asarray(disliked_rows, dtype=np.int64)])
+        neighbor_ids, neighbor_scores = top_k_matches(
+            scores, num_recommendations, exclude=seeds, allowed=facet_mask(similarity, filters)
+        )
+        return recommendation_list(similarity, neighbor_ids, neighbor_scores)
+
+def not_found_message(movie_name, similarity, name_it=False):
+    subject = f'"{movie_name}"' if name_it else "that one"
+    with metrics.stage('suggest'):
+        suggestions = similarity['title_index'].suggest(movie_name, n=3)
+    if suggestions:
+        return f"Hmm, couldn't find {subject}. Did you mean {', '.join(suggestions)}?"
+    return f"Hmm, couldn't find {subject}. Try another movie title?"
+
+def match_title(similarity, movie_name, cutoff=0.6):
+    # Catalog row of the closest title, or None. Answers are remembered in
+    # the model's resolution cache, so repeats skip the fuzzy match.
+    with metrics.stage('title_match'):
+        row, cached = similarity['resolution_cache'].resolve(movie_name, cutoff)
+    metrics.count('cinematch_title_resolutions_total', source='cache' if cached else 'index')
+    metrics.count('cinematch_title_matches_total', result='miss' if row is None else 'hit')
+    return row
+
+def complete_title(similarity, prefix, n=5):
+    # Most popular titles starting with what the user has typed so far
+    with metrics.stage('title_complete'):
+        rows = similarity['prefix_index'].complete(prefix, n)
+    return similarity['title_index'].titles.take(rows)
+
+def get_recommendations(movie_name, movies_data, similarity, num_recommendations=10, weights=None, filters=None):
+    try:
+        index_of_the_movie = match_title(similarity, movie_name)
+
+        if index_of_the_movie is None:
+            return None, not_found_message(movie_name, similarity)
+
+        close_match = similarity['title_index'].titles[index_of_the_movie]
+        recommendations = recommend(
+            movies_data, similarity, index_of_the_movie, num_recommendations, weights, filters
+        )
+        return recommendations, close_match
+    except Exception as e:
+        return None, f"Oops, something went wrong: {str(e)}"
+
+def get_profile_recommendations(liked_names, disliked_names, movies_data, similarity, num_recommendations=10,
+                                weights=None, filters=None):
+    # Like get_recommendations() for several liked (and optionally disliked)
+    # titles; returns the matched liked titles instead of a single match
+    try:
+        resolved = {}
+        for name in list(liked_names) + list(disliked_names):
+            resolved[name] = match_title(similarity, name)
+            if resolved[name] is None:
+                return None, not_found_message(name, similarity, name_it=True)
+
+        liked_rows = list(dict.fromkeys(resolved[name] for name in liked_names))
+        if not liked_rows:
+            return None, "Add at least one movie you liked."
+        disliked_rows = [row for row in dict.fromkeys(resolved[name] for name in disliked_names)
+                         if row not in liked_rows]
+
+        recommendations = recommend_for_profile(
+            movies_data, similarity, liked_rows, disliked_rows, num_recommendations, weights=weights, filters=filters
+        )
+        return recommendations, similarity['title_index'].titles.take(liked_rows)
+    except Exception as e:
+        return None, f"Oops, something went wrong: {str(e)}"
+
+def resolve_titles(title_index, names, cutoff=0.6):
+    # Catalog rows for many user-typed titles at once, -1 where nothing
+    # matches. Repeated names are matched only once.
+    resolved = {}
+    for name in set(names):
+        match = title_index.match(name, n=1, cutoff=cutoff)
+        resolved[name] = match[0][0] if match else -1
+    return np.array([resolved[name] for name in names], dtype=np.int64)
+
+def without_seeds(rows, neighbor_ids, neighbor_scores, k):
+    # Each row's list with the movie itself taken out by id, wherever ties
+    # put it, cut to k. Lists are k + 1 long, or the whole catalog.
+    keep = neighbor_ids != np.asarray(rows)[:, None]
+    length = min(k, neighbor_ids.shape[1] - 1)
+    keep &= np.cumsum(keep, axis=1) <= length
+    shape = (len(rows), length)
+    return neighbor_ids[keep].reshape(shape), neighbor_scores[keep].reshape(shape)
+
+def recommend_many(similarity, rows, k, workers=1, block_rows=SIMILARITY_BLOCK_ROWS):
+    # Yields (rows, neighbor_ids, neighbor_scores) blocks holding the k best
+    # recommendations for each row, the movie itself left out as in
+    # get_recommendations(), under the serving field weights. Lists the
+    # neighbor index covers are sliced out of it; longer ones, or any under
+    # other weights than the build's, are computed with blocked products.
+    rows = np.asarray(rows)
+    width = min(k + 1, similarity['feature_vectors'].shape[0])
+    weights = field_weights(similarity)
+    if width <= similarity['neighbor_ids'].shape[1] and weights == similarity['index_weights']:
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            yield (block, *without_seeds(
+                block, similarity['neighbor_ids'][block, :width], similarity['neighbor_scores'][block, :width], k
+            ))
+        return
+
+    vectors = index_vectors(
+        similarity['feature_vectors'], similarity['field_offsets'], [weights[field] for field in similarity['fields']]
+    )
+    for block, block_ids, block_scores in iter_neighbor_blocks(vectors, rows, width, block_rows, workers):
+        yield (block, *without_seeds(block, block_ids, block_scores, k))
+
+def read_catalog(catalog_path=CATALOG_PATH, columns=CATALOG_COLUMNS, memory_map=True):
+    # Just the given catalog columns, CATEGORICAL_COLUMNS as categoricals.
+    # Other CSV fields are all read as strings; columnar catalogs keep their
+    # types and need pyarrow. With memory_map an uncompressed Feather file
+    # is mapped instead of read.
+    categorical = [column for column in columns if column in CATEGORICAL_COLUMNS]
+    catalog_format = COLUMNAR_FORMATS.get(os.path.splitext(catalog_path)[1].lower())
+    if catalog_format is None:
+        dtypes = {column: 'category' if column in categorical else str for column in columns}
+        return pd.read_csv(catalog_path, usecols=columns, dtype=dtypes)[columns]
+
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ArtifactError(f"Reading {catalog_path} needs pyarrow (pip install pyarrow), or use the CSV catalog.")
+    if catalog_format == 'parquet':
+        table = pq.read_table(catalog_path, columns=columns, memory_map=memory_map)
+    else:
+        table = feather.read_table(catalog_path, columns=columns, memory_map=memory_map)
+    return table.to_pandas(categories=categorical)
+
+def convert_catalog(catalog_path, out_path):
+    # Typed columnar copy of a CSV catalog. Every column is kept, readers
+    # pick the ones they need. Feather is written uncompressed so it can be
+    # memory-mapped.
+    catalog_format = COLUMNAR_FORMATS.get(os.path.splitext(out_path)[1].lower())
+    if catalog_format is None:
+        raise ArtifactError(f"Can't tell the format of {out_path}, use a .parquet or .feather name.")
+    movies_data = pd.read_csv(catalog_path)
+    try:
+        if catalog_format == 'parquet':
+            movies_data.to_parquet(out_path, index=False)
+        else:
+            movies_data.to_feather(out_path, compression='uncompressed')
+    except ImportError:
+        raise ArtifactError(f"Writing {out_path} needs pyarrow (pip install pyarrow).")
+    return len(movies_data)
+
+def feature_fields(movies_data):
+    # {field: text per movie}. Categorical columns hold their values once; as
+    # object columns the rows just point at them.
+    return {feature: movies_data[feature].astype(object).fillna('') for feature in SELECTED_FEATURES}
+
+def compact_catalog(titles, popularity):
+    # All that is kept of the catalog once it is vectorized. Each title is
+    # one interned str and the column stays object dtype: to_numpy() is
+    # then free, where pandas' own string dtype would copy every title out
+    # on each call.
+    titles = np.array([sys.intern(str(title)) for title in titles], dtype=object)
+    return pd.DataFrame({
+        'title': pd.Series(titles, dtype=object, copy=False),
+        'popularity': np.asarray(popularity, dtype=np.float32)
+    })
+
+def mapped_catalog(titles, popularity):
+    # movies_data of a loaded artifact. With pyarrow the title column reads
+    # the mapped titles buffer in place, so the processes serving one
+    # artifact share it; without, every process decodes its own copy.
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return compact_catalog(titles, popularity)
+    column = pa.LargeStringArray.from_buffers(len(titles), pa.py_buffer(titles.offsets), pa.py_buffer(titles.data))
+    return pd.DataFrame({
+        'title': pd.Series(pd.arrays.ArrowExtensionArray(column), copy=False),
+        'popularity': np.asarray(popularity, dtype=np.float32)
+    })
+
+def build_facets(movies_data):
+    return FacetIndex.build(movies_data['genres'], movies_data['release_date'], movies_data['original_language'])
+
+def catalog_popularity(movies_data):
+    # TMDB popularity as float32, 0 where it is missing or not a number
+    return pd.to_numeric(movies_data['popularity'], errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+
+def index_titles(movies_data, similarity):
+    # Title index and prefix index for completions, built from the catalog
+    title_index = TitleIndex(movies_data['title'].tolist())
+    popularity = movies_data['popularity'].to_numpy()
+    similarity['title_index'] = title_index
+    similarity['prefix_index'] = PrefixIndex(title_index.by_normalized, popularity)
+    similarity['resolution_cache'] = warm_resolution_cache(title_index, popularity)
+
+def warm_resolution_cache(title_index, popularity):
+    # Each process keeps its own resolution cache, warmed with the most
+    # popular titles
+    resolution_cache = ResolutionCache(title_index)
+    resolution_cache.warm(np.argsort(-np.asarray(popularity), kind='stable')[:WARM_TITLES])
+    return resolution_cache
+
+def feature_hashes(fields):
+    # 64-bit digest of every row's feature text, so `engine.py update` can
+    # tell which rows changed since the artifact was written. The fields are
+    # joined with a separator that can't occur in them, so moving a word
+    # from one field to another changes the digest.
+    return np.array([
+        int.from_bytes(hashlib.blake2b('\x1f'.join(texts).encode(), digest_size=8).digest(), 'little')
+        for texts in zip(*(fields[feature] for feature in SELECTED_FEATURES))
+    ], dtype=np.uint64)
+
+def fit_field(documents):
+    # Unit-length TF-IDF rows of one field as TfidfVectorizer would fit them,
+    # plus its vocabulary, idf and token count. A field that is empty in
+    # every movie gets no terms.
+    # scikit-learn is only needed to fit a model, so serving never imports it
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+    counter = CountVectorizer()
+    try:
+        counts = counter.fit_transform(documents)
+    except ValueError:
+        return sparse.csr_matrix((len(documents), 0)), {}, np.empty(0), 0
+    transformer = TfidfTransformer().fit(counts)
+    return transformer.transform(counts).tocsr(), counter.vocabulary_, transformer.idf_, int(counts.sum())
+
+def vectorize(fields, vocabularies, idf, field_offsets):
+    # TF-IDF rows for {field: documents} against an already fitted vocabulary
+    # and idf, as fit_field() would give them; unknown terms are dropped.
+    # Also returns the token and out-of-vocabulary token counts.
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+
+    blocks, num_tokens, known_tokens = [], 0, 0
+    for i, feature in enumerate(SELECTED_FEATURES):
+        documents = fields[feature]
+        analyze = CountVectorizer().build_analyzer()
+        num_tokens += sum(len(analyze(document)) for document in documents)
+        if not vocabularies[feature]:
+            blocks.append(sparse.csr_matrix((len(documents), 0)))
+            continue
+        counts = CountVectorizer(vocabulary=vocabularies[feature]).transform(documents)
+        known_tokens += int(counts.sum())
+        field_idf = np.asarray(idf[field_offsets[i]:field_offsets[i + 1]])
+        blocks.append(normalize((counts @ sparse.diags(field_idf)).tocsr()))
+    return sparse.hstack(blocks).tocsr(), num_tokens, num_tokens - known_tokens
+
+def build_model(catalog_path=CATALOG_PATH, engine='exact', ann_postings=ANN_POSTINGS_PER_TERM,
+                workers=1, memory_mb=BUILD_MEMORY_MB, field_weights=None):
+    # field_weights overrides DEFAULT_FIELD_WEIGHTS for the neighbor index
+    weights = dict(DEFAULT_FIELD_WEIGHTS, **(field_weights or {}))
+    if not sum(weights.values()) > 0:
+        raise ValueError("At least one field weight must be above zero.")
+
+    with metrics.stage('build_read_catalog'):
+        movies_data = read_catalog(catalog_path)
+        fields = feature_fields(movies_data)
+
+    # Raw counts are kept for the vocabulary drift bookkeeping of
+    # `engine.py update`
+    with metrics.stage('build_vectorize'):
+        fitted = [fit_field(fields[feature]) for feature in SELECTED_FEATURES]
+        feature_vectors = sparse.hstack([block for block, _, _, _ in fitted]).tocsr()
+        field_offsets = np.cumsum([0] + [len(vocabulary) for _, vocabulary, _, _ in fitted])
+    similarity = {
+        'feature_vectors': feature_vectors,
+        'inverted_index': feature_vectors.T.tocsr(),
+        'fields': list(SELECTED_FEATURES),
+        'field_offsets': field_offsets,
+        'vocabulary': {feature: vocabulary for feature, (_, vocabulary, _, _) in zip(SELECTED_FEATURES, fitted)},
+        'idf': np.concatenate([idf for _, _, idf, _ in fitted]),
+        'row_hashes': feature_hashes(fields),
+        'vocabulary_tokens': sum(tokens for _, _, _, tokens in fitted),
+        'oov_tokens': 0,
+        'engine': engine,
+        'index_weights': weights,
+        'field_weights': weights,
+        'column_weights': {}
+    }
+    similarity['facets'] = build_facets(movies_data)
+    # The feature text isn't needed past this point, so it is freed before
+    # the neighbor index build, the peak of the whole build
+    movies_data = compact_catalog(movies_data['title'], catalog_popularity(movies_data))
+    del fields, fitted
+    weight_list = [weights[feature] for feature in SELECTED_FEATURES]
+    with metrics.stage('build_neighbor_index'):
+        if engine == 'ann':
+            similarity['ann'] = ImpactIndex(ann_postings).fit(similarity['inverted_index'])
+            neighbor_ids, neighbor_scores = build_ann_neighbor_index(
+                feature_vectors, similarity['ann'], field_offsets, weight_list
+            )
+        else:
+            neighbor_ids, neighbor_scores = build_neighbor_index(
+                index_vectors(feature_vectors, field_offsets, weight_list), workers=workers, memory_mb=memory_mb
+            )
+    similarity['neighbor_ids'] = neighbor_ids
+    similarity['neighbor_scores'] = neighbor_scores
+    with metrics.stage('build_title_index'):
+        index_titles(movies_data, similarity)
+
+    return movies_data, similarity
+
+def publish_model(version_dir, model_dir):
+    # Points the model_dir symlink at version_dir with one atomic
+    # os.replace(), so a reader finds either the old artifact or the new one.
+    # The version it replaced is kept for readers still loading it; older
+    # ones are removed. A model_dir that is still a plain directory (from
+    # before versioned builds) is moved aside first, the one time a reader
+    # can miss it.
+    if os.path.isdir(model_dir) and not os.path.islink(model_dir):
+        os.rename(model_dir, f"{model_dir}.v0-{os.getpid()}")
+    previous = os.path.realpath(model_dir) if os.path.islink(model_dir) else None
+    link = f"{model_dir}.tmp-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, model_dir)
+
+    keep = {os.path.realpath(version_dir), previous}
+    for retired_dir in glob.glob(f"{glob.escape(model_dir)}.v*"):
+        if os.path.realpath(retired_dir) not in keep:
+            shutil.rmtree(retired_dir, ignore_errors=True)
+
+def save_model(movies_data, similarity, catalog_path=CATALOG_PATH, model_dir=MODEL_DIR):
+    # Every build is written to a directory of its own, model_dir.v<time>,
+    # which model_dir is switched to at the end (see publish_model()), so a
+    # reader never sees a half-written artifact or none at all.
+    model_dir = os.path.normpath(model_dir)
+    staging_dir = f"{model_dir}.v{time.time_ns()}"
+    os.makedirs(staging_dir)
+
+    for name in ('feature_vectors', 'inverted_index'):
+        matrix = similarity[name]
+        np.save(os.path.join(staging_dir, f"{name}_data.npy"), matrix.data)
+        np.save(os.path.join(staging_dir, f"{name}_indices.npy"), matrix.indices)
+        np.save(os.path.join(staging_dir, f"{name}_indptr.npy"), matrix.indptr)
+    np.save(os.path.join(staging_dir, "neighbor_ids.npy"), similarity['neighbor_ids'])
+    np.save(os.path.join(staging_dir, "neighbor_scores.npy"), similarity['neighbor_scores'])
+    np.save(os.path.join(staging_dir, "idf.npy"), similarity['idf'])
+    np.save(os.path.join(staging_dir, "row_hashes.npy"), similarity['row_hashes'])
+    similarity['title_index'].save(staging_dir)
+    similarity['prefix_index'].save(staging_dir)
+    similarity['facets'].save(staging_dir)
+    np.save(os.path.join(staging_dir, "popularity.npy"), movies_data['popularity'].to_numpy(dtype=np.float32))
+    with open(os.path.join(staging_dir, "vocabulary.json"), "w") as f:
+        json.dump({
+            feature: {term: int(column) for term, column in vocabulary.items()}
+            for feature, vocabulary in similarity['vocabulary'].items()
+        }, f)
+    if similarity.get('ann') is not None:
+        similarity['ann'].save(staging_dir)
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'source': os.path.basename(catalog_path),
+        'source_sha256': file_sha256(catalog_path),
+        'built_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'num_movies': int(similarity['feature_vectors'].shape[0]),
+        'num_terms': int(similarity['feature_vectors'].shape[1]),
+        'fields': similarity['fields'],
+        'field_terms': np.diff(similarity['field_offsets']).tolist(),
+        'field_weights': similarity['index_weights'],
+        'neighbor_k': int(similarity['neighbor_ids'].shape[1] - 1),
+        'engine': similarity.get('engine', 'exact'),
+        'vocabulary_tokens': similarity['vocabulary_tokens'],
+        'oov_tokens': similarity['oov_tokens']
+    }
+    with open(os.path.join(staging_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    publish_model(staging_dir, model_dir)
+    return manifest
+
+def read_manifest(model_dir=MODEL_DIR):
+    manifest_path = os.path.join(model_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        raise ArtifactError(
+            f"No model artifact in '{model_dir}/'. Build it with `python engine.py build`."
+        )
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def load_model(model_dir=MODEL_DIR, catalog_path=CATALOG_PATH, engine=SEARCH_ENGINE, check_source=True,
+               field_weights=FIELD_WEIGHTS):
+    # Memory-maps a model written by save_model(): every array, the title
+    # indexes included, is read from the artifact's pages, which the
+    # processes serving one artifact share. The catalog hash check
+    # refuses to serve an artifact built from a different CSV. field_weights
+    # ("director=2,...") changes the serving weights from the build's.
+    # model_dir is resolved once per attempt, so files of two versions are
+    # never mixed; a version retired while it was being mapped (builds in
+    # quick succession) is given up for the current one.
+    for attempt in range(LOAD_ATTEMPTS):
+        artifact_dir = os.path.realpath(model_dir)
+        try:
+            return map_artifact(artifact_dir, catalog_path, engine, check_source, field_weights, model_dir)
+        except (FileNotFoundError, ArtifactError):
+            if attempt == LOAD_ATTEMPTS - 1 or os.path.realpath(model_dir) == artifact_dir:
+                raise
+
+def map_artifact(artifact_dir, catalog_path, engine, check_source, field_weights, model_dir):
+    # load_model() for one resolved version directory; model_dir is the name
+    # errors give
+    manifest = read_manifest(artifact_dir)
+    engine = engine or manifest.get('engine', 'exact')
+    if engine not in ('exact', 'ann'):
+        raise ArtifactError(f"Unknown search engine '{engine}', use 'exact' or 'ann'.")
+    if engine == 'ann' and manifest.get('engine') != 'ann':
+        raise ArtifactError(
+            f"Model artifact in '{model_dir}/' has no ANN index. "
+            f"Rebuild it with `python engine.py build --engine ann`."
+        )
+    if manifest.get('version') != ARTIFACT_VERSION:
+        raise ArtifactError(
+            f"Model artifact version {manifest.get('version')} is not supported "
+            f"(expected {ARTIFACT_VERSION}). Rebuild it with `python engine.py build`."
+        )
+    with metrics.stage('load_verify_source'):
+        source_changed = check_source and manifest['source_sha256'] != file_sha256(catalog_path)
+    if source_changed:
+        raise ArtifactError(
+            f"Model artifact in '{model_dir}/' was built from a different {catalog_path}. "
+            f"Rebuild it with `python engine.py build`."
+        )
+
+    def mapped(name):
+        return np.load(os.path.join(artifact_dir, f"{name}.npy"), mmap_mode='r')
+
+    def mapped_csr(name, shape):
+        return sparse.csr_matrix(
+            (mapped(f"{name}_data"), mapped(f"{name}_indices"), mapped(f"{name}_indptr")),
+            shape=shape,
+            copy=False
+        )
+
+    index_weights = manifest['field_weights']
+    try:
+        serving_weights = dict(index_weights, **parse_field_weights(field_weights))
+    except ValueError as e:
+        raise ArtifactError(f"Bad field weights '{field_weights}': {e}")
+    if not sum(serving_weights.values()) > 0:
+        raise ArtifactError(f"Bad field weights '{field_weights}': at least one must be above zero.")
+
+    num_movies, num_terms = manifest['num_movies'], manifest['num_terms']
+    with metrics.stage('load_map_arrays'):
+        similarity = {
+            'feature_vectors': mapped_csr('feature_vectors', (num_movies, num_terms)),
+            'inverted_index': mapped_csr('inverted_index', (num_terms, num_movies)),
+            'neighbor_ids': mapped('neighbor_ids'),
+            'neighbor_scores': mapped('neighbor_scores'),
+            'idf': mapped('idf'),
+            'fields': manifest['fields'],
+            'field_offsets': np.cumsum([0] + manifest['field_terms']),
+            'index_weights': index_weights,
+            'field_weights': serving_weights,
+            'column_weights': {},
+            'engine': engine
+        }
+        similarity['facets'] = FacetIndex.load(artifact_dir)
+        if engine == 'ann':
+            similarity['ann'] = ImpactIndex.load(artifact_dir)
+    with metrics.stage('load_title_index'):
+        title_index = TitleIndex.load(artifact_dir)
+        popularity = mapped('popularity')
+        similarity['title_index'] = title_index
+        similarity['prefix_index'] = PrefixIndex.load(artifact_dir, title_index.by_normalized)
+        similarity['resolution_cache'] = warm_resolution_cache(title_index, popularity)
+        movies_data = mapped_catalog(title_index.titles, popularity)
+
+    return movies_data, similarity
+
+def patch_neighbor_index(feature_vectors, kept_ids, kept_scores, kept_rows, dirty_rows,
+                         block_rows=SIMILARITY_BLOCK_ROWS):
+    # Neighbor lists after an incremental update. kept_ids / kept_scores are
+    # the old lists of the unchanged kept_rows, renumbered to the new catalog
+    # order with -1 for neighbors that were deleted or changed. Lists that
+    # lost a neighbor (or were padded with zero-score filler) are recomputed
+    # along with the dirty rows; the others only merge in their scores
+    # against the dirty rows, which can only push out their tail.
+    num_movies = feature_vectors.shape[0]
+    width = kept_ids.shape[1]
+    neighbor_ids = np.empty((num_movies, width), dtype=np.int32)
+    neighbor_scores = np.empty((num_movies, width), dtype=np.float32)
+    neighbor_ids[kept_rows] = kept_ids
+    neighbor_scores[kept_rows] = kept_scores
+
+    stale = (kept_ids < 0).any(axis=1) | (kept_scores <= 0).any(axis=1)
+    relist = np.union1d(dirty_rows, kept_rows[stale])
+    mergeable = np.zeros(num_movies, dtype=bool)
+    mergeable[kept_rows[~stale]] = True
+    merged = set()
+
+    for start in range(0, len(dirty_rows), block_rows):
+        block = dirty_rows[start:start + block_rows]
+        cross = (feature_vectors[block] @ feature_vectors.T).tocsc()
+        cross.data = cross.data.astype(np.float32)
+        best = cross.max(axis=0).toarray().ravel()
+        for row in np.flatnonzero(mergeable & (best > 0) & (best >= neighbor_scores[:, -1])):
+            column = slice(cross.indptr[row], cross.indptr[row + 1])
+            ids = np.concatenate([neighbor_ids[row], block[cross.indices[column]]])
+            scores = np.concatenate([neighbor_scores[row], cross.data[column]])
+            # Candidates in catalog order, so ties rank like a full rebuild
+            order = np.argsort(ids, kind='stable')
+            top = order[top_k_indices(scores[order], width)]
+            neighbor_ids[row] = ids[top]
+            neighbor_scores[row] = scores[top]
+            merged.add(int(row))
+
+    for rows, block_ids, block_scores in iter_neighbor_blocks(feature_vectors, relist, width, block_rows):
+        neighbor_ids[rows] = block_ids
+        neighbor_scores[rows] = block_scores
+
+    return neighbor_ids, neighbor_scores, len(relist), len(merged)
+
+def update_model(catalog_path=CATALOG_PATH, model_dir=MODEL_DIR, drift_threshold=VOCABULARY_DRIFT_THRESHOLD):
+    # Brings the artifact in model_dir up to date with an edited catalog
+    # without refitting. Movies are matched by title; only added and changed
+    # rows are vectorized, against the artifact's vocabulary and idf. Falls
+    # back to a full build once the out-of-vocabulary tokens dropped since
+    # the last build pass drift_threshold. Returns the new manifest and a
+    # summary of the changes.
+    manifest = read_manifest(model_dir)
+    engine = manifest.get('engine', 'exact')
+    old_movies, old_similarity = load_model(model_dir, catalog_path, engine, check_source=False, field_weights='')
+    changes = {
+        'added': 0, 'changed': 0, 'deleted': 0, 'relisted': 0, 'merged': 0, 'rebuilt': False,
+        'drift': manifest['oov_tokens'] / max(manifest['vocabulary_tokens'], 1)
+    }
+    if manifest['source_sha256'] == file_sha256(catalog_path):
+        return manifest, changes
+
+    movies_data = read_catalog(catalog_path)
+    fields = feature_fields(movies_data)
+    titles = movies_data['title'].astype(str).to_numpy()
+    old_titles = old_movies['title'].to_numpy()
+    old_row_of = {title: row for row, title in enumerate(old_titles)}
+    if len(set(titles)) != len(titles) or len(old_row_of) != len(old_titles):
+        raise ArtifactError(
+            f"{catalog_path} has duplicate titles, so its rows can't be matched to the artifact. "
+            f"Rebuild it with `python engine.py build`."
+        )
+
+    row_hashes = feature_hashes(fields)
+    previous = np.array([old_row_of.get(title, -1) for title in titles], dtype=np.int64)
+    kept = previous >= 0
+    kept[kept] = np.load(os.path.join(model_dir, "row_hashes.npy"))[previous[kept]] == row_hashes[kept]
+    kept_rows, dirty_rows = np.flatnonzero(kept), np.flatnonzero(~kept)
+    changes['added'] = int((previous < 0).sum())
+    changes['changed'] = len(dirty_rows) - changes['added']
+    changes['deleted'] = len(old_titles) - int((previous >= 0).sum())
+
+    with open(os.path.join(model_dir, "vocabulary.json")) as f:
+        vocabulary = json.load(f)
+    idf = np.array(old_similarity['idf'])
+    field_offsets = old_similarity['field_offsets']
+    new_vectors, _, oov_tokens = vectorize(
+        {feature: documents.iloc[dirty_rows] for feature, documents in fields.items()}, vocabulary, idf, field_offsets
+    )
+    oov_tokens += manifest['oov_tokens']
+    changes['drift'] = oov_tokens / max(manifest['vocabulary_tokens'], 1)
+
+    if changes['drift'] > drift_threshold:
+        ann_postings = old_similarity['ann'].postings_per_term if engine == 'ann' else ANN_POSTINGS_PER_TERM
+        movies_data, similarity = build_model(
+            catalog_path, engine, ann_postings, field_weights=manifest['field_weights']
+        )
+        changes['rebuilt'] = True
+        changes['relisted'] = len(movies_data)
+        return save_model(movies_data, similarity, catalog_path, model_dir), changes
+
+    # Kept rows reuse their stored vectors; stacked after them, the new
+    # vectors are then put back in catalog order
+    position = np.empty(len(titles), dtype=np.int64)
+    position[kept_rows] = np.arange(len(kept_rows))
+    position[dirty_rows] = len(kept_rows) + np.arange(len(dirty_rows))
+    feature_vectors = sparse.vstack([
+        old_similarity['feature_vectors'][previous[kept_rows]], new_vectors
+    ]).tocsr()[position]
+
+    weights = manifest['field_weights']
+    weighted_vectors = index_vectors(feature_vectors, field_offsets, [weights[field] for field in manifest['fields']])
+    width = min(manifest['neighbor_k'] + 1, len(titles))
+    if width == old_similarity['neighbor_ids'].shape[1]:
+        new_row_of = np.full(len(old_titles), -1, dtype=np.int64)
+        new_row_of[previous[kept_rows]] = kept_rows
+        neighbor_ids, neighbor_scores, changes['relisted'], changes['merged'] = patch_neighbor_index(
+            weighted_vectors,
+            new_row_of[old_similarity['neighbor_ids'][previous[kept_rows]]],
+            old_similarity['neighbor_scores'][previous[kept_rows]],
+            kept_rows,
+            dirty_rows
+        )
+    else:
+        # The catalog grew or shrank across neighbor_k + 1 movies, so every
+        # list changes length
+        neighbor_ids, neighbor_scores = build_neighbor_index(weighted_vectors, manifest['neighbor_k'])
+        changes['relisted'] = len(titles)
+
+    similarity = {
+        'feature_vectors': feature_vectors,
+        'inverted_index': feature_vectors.T.tocsr(),
+        'neighbor_ids': neighbor_ids,
+        'neighbor_scores': neighbor_scores,
+        'fields': manifest['fields'],
+        'field_offsets': field_offsets,
+        'index_weights': weights,
+        'vocabulary': vocabulary,
+        'idf': idf,
+        'row_hashes': row_hashes,
+        'vocabulary_tokens': manifest['vocabulary_tokens'],
+        'oov_tokens': oov_tokens,
+        'engine': engine
+    }
+    if engine == 'ann':
+        similarity['ann'] = ImpactIndex(old_similarity['ann'].postings_per_term).fit(similarity['inverted_index'])
+    similarity['facets'] = build_facets(movies_data)
+    movies_data = compact_catalog(titles, catalog_popularity(movies_data))
+    index_titles(movies_data, similarity)
+
+    return save_model(movies_data, similarity, catalog_path, model_dir), changes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the CineMatch model artifact.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="fit the model from the catalog and write the artifact")
+    build.add_argument('--catalog', default=CATALOG_PATH)
+    build.add_argument('--out', default=MODEL_DIR)
+    build.add_argument('--engine', choices=['exact', 'ann'], default='exact',
+                       help="'ann' adds an approximate index and builds the neighbor lists from it")
+    build.add_argument('--ann-postings', type=int, default=ANN_POSTINGS_PER_TERM,
+                       help="postings kept per term in the approximate index")
+    build.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                       help="processes computing the exact neighbor lists")
+    build.add_argument('--memory-mb', type=int, default=BUILD_MEMORY_MB,
+                       help="memory ceiling for the similarity blocks, over all workers")
+    build.add_argument('--field-weights', type=parse_field_weights, default={},
+                       help="weights for the neighbor index, e.g. 'director=2,tagline=0.5'")
+
+    convert = commands.add_parser('convert', help="write a typed columnar copy of the catalog CSV")
+    convert.add_argument('--catalog', default='movies_preprocessed.csv')
+    convert.add_argument('--out', required=True, help="a .parquet or .feather file")
+
+    update = commands.add_parser('update', help="apply catalog edits to the artifact without a refit")
+    update.add_argument('--catalog', default=CATALOG_PATH)
+    update.add_argument('--model', default=MODEL_DIR)
+    update.add_argument('--max-drift', type=float, default=VOCABULARY_DRIFT_THRESHOLD,
+                        help="vocabulary drift that triggers a full rebuild instead")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        movies_data, similarity = build_model(
+            args.catalog, args.engine, args.ann_postings, args.workers, args.memory_mb, args.field_weights
+        )
+        manifest = save_model(movies_data, similarity, args.catalog, args.out)
+        print(
+            f"Built {args.out}/ from {args.catalog}: {manifest['num_movies']} movies, "
+            f"{manifest['num_terms']} terms in {time.perf_counter() - started:.1f}s"
+        )
+    elif args.command == 'convert':
+        started = time.perf_counter()
+        num_movies = convert_catalog(args.catalog, args.out)
+        print(f"Wrote {num_movies} movies from {args.catalog} to {args.out} in {time.perf_counter() - started:.1f}s")
+    elif args.command == 'update':
+        started = time.perf_counter()
+        manifest, changes = update_model(args.catalog, args.model, args.max_drift)
+        if changes['rebuilt']:
+            print(f"Vocabulary drift {changes['drift']:.2%} passed {args.max_drift:.2%}, rebuilt {args.model}/ from scratch")
+        print(
+            f"Updated {args.model}/ from {args.catalog}: {changes['added']} added, {changes['changed']} changed, "
+            f"{changes['deleted']} deleted, {changes['relisted']} neighbor lists recomputed and "
+            f"{changes['merged']} patched in {time.perf_counter() - started:.1f}s "
+            f"(vocabulary drift {changes['drift']:.2%})"
+        )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# TMDB's genre names. The catalog joins a movie's genres with spaces, so the
+# two-word names are matched before single words; words outside this list
+# become genres of their own.
+GENRE_NAMES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'Foreign', 'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Science Fiction',
+    'TV Movie', 'Thriller', 'War', 'Western'
+]
+GENRE_PATTERN = re.compile(
+    r"|".join(re.escape(name) for name in sorted(GENRE_NAMES, key=len, reverse=True)) + r"|\S+"
+)
+
+def split_genres(text):
+    return GENRE_PATTERN.findall(text) if isinstance(text, str) else []
+
+def release_years(release_dates):
+    # Year of each "YYYY-MM-DD" date, 0 where it is missing
+    years = pd.to_numeric(pd.Series(release_dates).astype(str).str[:4], errors='coerce')
+    return years.fillna(0).to_numpy(dtype=np.int16)
+
+class FacetIndex:
+    # What recommendations can be filtered on: a packed bitmap of the movies
+    # in each genre, and each movie's release year and original language.
+    # mask() turns a filter into a boolean mask over the catalog, applied to
+    # the scores before the top-k is taken.
+
+    def __init__(self, genre_names, genre_bits, years, language_names, languages):
+        self.genre_names = list(genre_names)
+        self.genre_bits = genre_bits
+        self.years = years
+        self.language_names = list(language_names)
+        self.languages = languages
+        self._genre_rows = {name.lower(): row for row, name in enumerate(self.genre_names)}
+        self._language_codes = {name.lower(): code for code, name in enumerate(self.language_names)}
+
+    @classmethod
+    def build(cls, genres, release_dates, languages):
+        # Genres and languages are split per distinct value, so a catalog
+        # column read as a categorical is parsed once per category
+        genres = pd.Series(genres).astype('category')
+        category_genres = [split_genres(text) for text in genres.cat.categories]
+        genre_names = sorted(set().union(*category_genres))
+        genre_rows = {name: row for row, name in enumerate(genre_names)}
+        # The extra last column, all False, is where missing values (code -1) land
+        member = np.zeros((len(genre_names), len(category_genres) + 1), dtype=bool)
+        for category, names in enumerate(category_genres):
+            member[[genre_rows[name] for name in names], category] = True
+        genre_bits = np.packbits(member[:, genres.cat.codes.to_numpy()], axis=1)
+
+        languages = pd.Series(languages).astype('category')
+        return cls(
+            genre_names, genre_bits, release_years(release_dates),
+            [str(name) for name in languages.cat.categories], languages.cat.codes.to_numpy().astype(np.int16)
+        )
+
+    @property
+    def num_movies(self):
+        return len(self.years)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "facet_genre_bits.npy"), self.genre_bits)
+        np.save(os.path.join(directory, "facet_years.npy"), self.years)
+        np.save(os.path.join(directory, "facet_languages.npy"), self.languages)
+        with open(os.path.join(directory, "facets.json"), "w") as f:
+            json.dump({'genres': self.genre_names, 'languages': self.language_names}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, "facets.json")) as f:
+            names = json.load(f)
+        # Plain ndarray views of the mapped files skip np.memmap's overhead
+        # on every operation
+        arrays = [
+            np.load(os.path.join(directory, f"facet_{name}.npy"), mmap_mode=mmap_mode).view(np.ndarray)
+            for name in ('genre_bits', 'years', 'languages')
+        ]
+        return cls(names['genres'], arrays[0], arrays[1], names['languages'], arrays[2])
+
+    def year_range(self):
+        # (first, last) known release year
+        known = self.years[self.years > 0]
+        return (int(known.min()), int(known.max())) if len(known) else (0, 0)
+
+    def mask(self, genres=(), languages=(), min_year=None, max_year=None):
+        # Movies in any of the genres, in any of the languages, released
+        # within the years given; None when nothing is filtered. Names are
+        # matched case-insensitively; an unknown one raises ValueError.
+        allowed = None
+        if genres:
+            rows = []
+            for genre in genres:
+                if genre.lower() not in self._genre_rows:
+                    raise ValueError(f"Unknown genre '{genre}', use one of {', '.join(self.genre_names)}.")
+                rows.append(self._genre_rows[genre.lower()])
+            bits = np.bitwise_or.reduce(self.genre_bits[rows], axis=0)
+            allowed = np.unpackbits(bits, count=self.num_movies).view(bool)
+        if languages:
+            # A lookup per code; the extra last entry, always False, is
+            # where missing languages (code -1) land
+            wanted = np.zeros(len(self.language_names) + 1, dtype=bool)
+            for language in languages:
+                if language.lower() not in self._language_codes:
+                    raise ValueError(f"Unknown language '{language}', use one of {', '.join(self.language_names)}.")
+                wanted[self._language_codes[language.lower()]] = True
+            in_language = wanted[self.languages]
+            allowed = in_language if allowed is None else allowed & in_language
+        for bound, passes in ((min_year, np.greater_equal), (max_year, np.less_equal)):
+            if bound is not None:
+                in_years = passes(self.years, bound) & (self.years > 0)
+                allowed = in_years if allowed is None else allowed & in_years
+        return allowed
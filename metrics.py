@@ -0,0 +1,169 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# In-process timings and counters shared by the app, the service and the
+# model code, exported in the Prometheus text format:
+#   with metrics.stage('title_match'):
+#       ...
+#   metrics.count('cinematch_poster_lookups_total', outcome='cache_hit')
+#   metrics.render()   # text for a /metrics endpoint
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+METRIC_HELP = {
+    'cinematch_stage_seconds': "Time spent in each stage of loading, matching, ranking and rendering",
+    'cinematch_title_matches_total': "Typed titles looked up, by whether one matched",
+    'cinematch_title_resolutions_total': "Typed titles resolved, by whether the resolution cache answered",
+    'cinematch_poster_lookups_total': "Poster lookups, by where the answer came from",
+    'cinematch_tmdb_responses_total': "Responses from the TMDB search API, by status code or failure",
+    'cinematch_poster_deadline_misses_total': "Poster lookups still running when their page deadline passed",
+    'cinematch_http_requests_total': "Requests answered by the JSON service, by route and status",
+    'cinematch_process_resident_memory_bytes': "Resident memory of this process",
+    'cinematch_process_peak_resident_memory_bytes': "Peak resident memory of this process"
+}
+
+class Registry:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = list(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0, 'last': 0.0
+                }
+            series['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+            series['count'] += 1
+            series['sum'] += seconds
+            series['last'] = seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('cinematch_stage_seconds', time.perf_counter() - started, stage=name)
+
+    def stages(self):
+        # {stage: {count, last_ms, mean_ms, p95_ms}} for the diagnostics panel;
+        # p95 is the upper bound of the bucket it falls in
+        with self._lock:
+            series = {
+                dict(labels)['stage']: dict(values, counts=list(values['counts']))
+                for (name, labels), values in self._histograms.items()
+                if name == 'cinematch_stage_seconds'
+            }
+        summary = {}
+        for stage, values in sorted(series.items()):
+            rank, cumulative, p95 = 0.95 * values['count'], 0, float('inf')
+            for bound, count in zip(self.buckets + [float('inf')], values['counts']):
+                cumulative += count
+                if cumulative >= rank:
+                    p95 = bound
+                    break
+            summary[stage] = {
+                'count': values['count'],
+                'last_ms': round(values['last'] * 1000, 2),
+                'mean_ms': round(values['sum'] / values['count'] * 1000, 2),
+                'p95_ms': round(p95 * 1000, 2)
+            }
+        return summary
+
+    def counters(self, name):
+        # {labels: value} of one counter
+        with self._lock:
+            return {labels: value for (counter, labels), value in self._counters.items() if counter == name}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(values, counts=list(values['counts']))) for key, values in self._histograms.items()
+            )
+
+        described = set()
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), values in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], values['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {values['sum']:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {values['count']}")
+
+        resident, peak = memory_usage()
+        for name, value in (('cinematch_process_resident_memory_bytes', resident),
+                            ('cinematch_process_peak_resident_memory_bytes', peak)):
+            if value is not None:
+                describe(name, 'gauge')
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+def memory_usage():
+    # (current, peak) resident set size in bytes, None where unknown
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        resident = None
+    if resident is not None and peak is not None:
+        # ru_maxrss is only refreshed now and then
+        peak = max(peak, resident)
+    return resident, peak
+
+REGISTRY = Registry()
+
+count = REGISTRY.count
+observe = REGISTRY.observe
+stage = REGISTRY.stage
+render = REGISTRY.render
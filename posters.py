@@ -0,0 +1,369 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY', '0b78123bc2f438d6b6d11c94f882d34b')
+TMDB_SEARCH_URL = os.environ.get('TMDB_SEARCH_URL', 'https://api.themoviedb.org/3/search/movie')
+TMDB_IMAGE_URL = os.environ.get('TMDB_IMAGE_URL', 'https://image.tmdb.org/t/p/w500')
+PLACEHOLDER_POSTER = "https://via.placeholder.com/500x750?text=No+Poster"
+
+POSTER_CACHE_PATH = os.path.join('.cache', 'posters.sqlite3')
+POSTER_CACHE_MAX_ENTRIES = 50000
+# Found posters are trusted for a week, "no poster" answers for a day
+POSTER_TTL = 7 * 24 * 3600
+MISSING_POSTER_TTL = 24 * 3600
+
+# Concurrent poster lookups across all sessions, and the time a results page
+# waits for them before showing placeholders for the stragglers
+POSTER_WORKERS = 8
+POSTER_REQUEST_TIMEOUT = 5
+POSTER_PAGE_DEADLINE = 6
+
+# Thumbnails written by `python prefetch.py`. They live under static/, which
+# Streamlit serves at app/static/ (see .streamlit/config.toml); the title ->
+# file map is kept in SQLite next to the poster cache.
+THUMBNAIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'thumbs')
+THUMBNAIL_URL = "app/static/thumbs"
+THUMBNAIL_INDEX_PATH = os.path.join('.cache', 'thumbnails.sqlite3')
+# Cards are at most a few hundred pixels wide; w500 originals are shrunk to this
+THUMBNAIL_WIDTH = 342
+THUMBNAIL_QUALITY = 80
+# Requests per second the prefetch job sends to TMDB, searches and image
+# downloads together; TMDB starts answering 429 at around 50
+PREFETCH_RATE = 20
+# Times one title is tried again after a 429, once the Retry-After has passed
+PREFETCH_RETRIES = 3
+
+_session = None
+_executor = None
+_pool_lock = threading.Lock()
+
+class PosterCache:
+    # Title -> poster URL map kept in SQLite so it survives restarts. Titles
+    # without a poster are cached too (as NULL), with a shorter TTL. The least
+    # recently used entries are evicted once max_entries is exceeded.
+
+    def __init__(self, path=POSTER_CACHE_PATH, max_entries=POSTER_CACHE_MAX_ENTRIES,
+                 ttl=POSTER_TTL, missing_ttl=MISSING_POSTER_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS posters ("
+            " title TEXT PRIMARY KEY,"
+            " poster_url TEXT,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS posters_last_used ON posters (last_used)")
+
+    def get(self, title):
+        # (True, url) on a hit, where url is None for a cached "no poster";
+        # (False, None) on a miss or an expired entry.
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT poster_url, expires_at FROM posters WHERE title = ?", (title,)
+            ).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return False, None
+            poster_url, expires_at = row
+            if expires_at <= now:
+                self._db.execute("DELETE FROM posters WHERE title = ?", (title,))
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return False, None
+            self._db.execute("UPDATE posters SET last_used = ? WHERE title = ?", (now, title))
+            self.counters['hits' if poster_url else 'negative_hits'] += 1
+            return True, poster_url
+
+    def put(self, title, poster_url):
+        now = time.time()
+        ttl = self.ttl if poster_url else self.missing_ttl
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO posters (title, poster_url, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (title, poster_url, now + ttl, now)
+            )
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM posters").fetchone()
+            if entries > self.max_entries:
+                evicted = self._db.execute(
+                    "DELETE FROM posters WHERE title IN"
+                    " (SELECT title FROM posters ORDER BY last_used LIMIT ?)",
+                    (entries - self.max_entries,)
+                ).rowcount
+                self.counters['evictions'] += evicted
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM posters").fetchone()
+            stats = dict(self.counters, entries=entries)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+class ThumbnailStore:
+    # Resized posters on local disk, content-addressed: each file is named
+    # by the SHA-256 of its bytes, two directory levels deep, so titles that
+    # share a poster share one file. Each title's row holds its digest, or
+    # NULL when TMDB has no poster for it; titles with a row are done, and
+    # prefetch runs skip them.
+
+    def __init__(self, root=THUMBNAIL_DIR, index_path=THUMBNAIL_INDEX_PATH, url_prefix=THUMBNAIL_URL):
+        os.makedirs(root, exist_ok=True)
+        if os.path.dirname(index_path):
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.root = root
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " title TEXT PRIMARY KEY,"
+            " digest TEXT,"
+            " stored_at REAL NOT NULL)"
+        )
+
+    def relative_path(self, digest):
+        return os.path.join(digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def get(self, title):
+        # (True, url) for a stored title, where url is None when it has no
+        # poster; (False, None) when it hasn't been fetched or its file is gone
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM thumbnails WHERE title = ?", (title,)).fetchone()
+        if row is None:
+            return False, None
+        (digest,) = row
+        if digest is None:
+            return True, None
+        if not os.path.exists(os.path.join(self.root, self.relative_path(digest))):
+            return False, None
+        return True, f"{self.url_prefix}/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+    def put(self, title, image_bytes):
+        # Stores a thumbnail of image_bytes (None: no poster) for title and
+        # returns its digest. The file is complete before the row is written,
+        # so an interrupted run never leaves a title pointing at half a file.
+        digest = None
+        if image_bytes is not None:
+            thumbnail = make_thumbnail(image_bytes)
+            digest = hashlib.sha256(thumbnail).hexdigest()
+            path = os.path.join(self.root, self.relative_path(digest))
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                with open(partial, "wb") as f:
+                    f.write(thumbnail)
+                os.replace(partial, path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO thumbnails (title, digest, stored_at) VALUES (?, ?, ?)",
+                (title, digest, time.time())
+            )
+        return digest
+
+    def stored_titles(self):
+        with self._lock:
+            return {title for (title,) in self._db.execute("SELECT title FROM thumbnails")}
+
+    def stats(self):
+        with self._lock:
+            entries, with_poster, files = self._db.execute(
+                "SELECT COUNT(*), COUNT(digest), COUNT(DISTINCT digest) FROM thumbnails"
+            ).fetchone()
+        return {'entries': entries, 'with_poster': with_poster, 'files': files}
+
+def make_thumbnail(image_bytes, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    # JPEG no wider than width. Pillow comes with Streamlit; it is imported
+    # here so the app and the service load without it.
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+class RateLimiter:
+    # Spaces calls from every thread at least 1/rate seconds apart. pause()
+    # holds them all back, say for the Retry-After of a 429.
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+def get_session():
+    # Keep-alive connections to TMDB shared by every lookup
+    global _session
+    with _pool_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POSTER_WORKERS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+def get_executor():
+    global _executor
+    with _pool_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POSTER_WORKERS, thread_name_prefix='poster')
+        return _executor
+
+def search_poster(movie_title, session=None):
+    # TMDB poster URL of the best match for the title, None when it has no
+    # poster. Raises requests.RequestException or ValueError when the lookup
+    # fails.
+    try:
+        with metrics.stage('poster_http'):
+            response = (session or requests).get(
+                TMDB_SEARCH_URL,
+                params={'api_key': TMDB_API_KEY, 'query': movie_title},
+                timeout=POSTER_REQUEST_TIMEOUT
+            )
+    except requests.Timeout:
+        metrics.count('cinematch_tmdb_responses_total', status='timeout')
+        raise
+    except requests.ConnectionError:
+        metrics.count('cinematch_tmdb_responses_total', status='connection_error')
+        raise
+    metrics.count('cinematch_tmdb_responses_total', status=str(response.status_code))
+    response.raise_for_status()
+    data = response.json()
+
+    if data.get('results'):
+        poster_path = data['results'][0].get('poster_path')
+        if poster_path:
+            return f"{TMDB_IMAGE_URL}{poster_path}"
+    return None
+
+def fetch_poster(movie_title, cache=None, session=None):
+    if cache is not None:
+        found, poster_url = cache.get(movie_title)
+        if found:
+            metrics.count('cinematch_poster_lookups_total', outcome='cache_hit' if poster_url else 'cache_negative_hit')
+            return poster_url or PLACEHOLDER_POSTER
+
+    try:
+        poster_url = search_poster(movie_title, session)
+    except (requests.RequestException, ValueError) as e:
+        # Not cached: the next search retries the lookup. Only the exception
+        # type is logged, its message carries the URL with the API key.
+        logger.warning("Poster lookup for %r failed: %s", movie_title, type(e).__name__)
+        metrics.count('cinematch_poster_lookups_total', outcome='error')
+        return PLACEHOLDER_POSTER
+
+    metrics.count('cinematch_poster_lookups_total', outcome='found' if poster_url else 'not_found')
+    if cache is not None:
+        cache.put(movie_title, poster_url)
+    return poster_url or PLACEHOLDER_POSTER
+
+def prefetch_poster(movie_title, store, limiter, session=None, retries=PREFETCH_RETRIES):
+    # Looks up one title's poster and stores its thumbnail. Returns 'stored',
+    # 'missing' (TMDB has none, also recorded) or 'error'; failed titles are
+    # left unrecorded, so the next run tries them again. A 429 pauses every
+    # worker for its Retry-After before the title is tried again.
+    for attempt in range(retries + 1):
+        try:
+            limiter.wait()
+            poster_url = search_poster(movie_title, session)
+            image_bytes = None
+            if poster_url:
+                limiter.wait()
+                with metrics.stage('poster_download'):
+                    response = (session or requests).get(poster_url, timeout=POSTER_REQUEST_TIMEOUT)
+                response.raise_for_status()
+                image_bytes = response.content
+            store.put(movie_title, image_bytes)
+            return 'stored' if image_bytes is not None else 'missing'
+        except (requests.RequestException, ValueError, OSError) as e:
+            # OSError covers images Pillow can't read and a full disk
+            response = getattr(e, 'response', None)
+            if response is not None and response.status_code == 429 and attempt < retries:
+                retry_after = response.headers.get('Retry-After', '')
+                limiter.pause(float(retry_after) if retry_after.isdigit() else 1.0)
+                continue
+            logger.warning("Poster prefetch for %r failed: %s", movie_title, type(e).__name__)
+            return 'error'
+
+def iter_posters(titles, cache=None, deadline=POSTER_PAGE_DEADLINE, thumbnails=None):
+    # Yields (position, poster_url) for each title as its lookup finishes.
+    # Titles with a local thumbnail are answered from it straight away.
+    # Lookups unfinished when the deadline passes yield the placeholder. The
+    # ones already running keep going in the background and fill the cache
+    # for next time; the ones still queued are cancelled, so a slow page
+    # can't leave a backlog on the shared pool for the pages after it.
+    local = {}
+    if thumbnails is not None:
+        for position, title in enumerate(titles):
+            found, poster_url = thumbnails.get(title)
+            if found:
+                metrics.count('cinematch_poster_lookups_total', outcome='local' if poster_url else 'local_missing')
+                local[position] = poster_url or PLACEHOLDER_POSTER
+
+    session = get_session()
+    executor = get_executor()
+    futures = {
+        executor.submit(fetch_poster, title, cache, session): position
+        for position, title in enumerate(titles) if position not in local
+    }
+    yield from local.items()
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            pending.discard(future)
+            yield futures[future], future.result()
+    except TimeoutError:
+        logger.warning("%d of %d poster lookups missed the %ss deadline", len(pending), len(futures), deadline)
+        metrics.count('cinematch_poster_deadline_misses_total', sum(not future.done() for future in pending))
+        for future in pending:
+            if not future.cancel() and future.done():
+                yield futures[future], future.result()
+            else:
+                yield futures[future], PLACEHOLDER_POSTER
+    finally:
+        # Also when the page stops reading early (a rerun)
+        for future in pending:
+            future.cancel()
+
+def fetch_posters(titles, cache=None, deadline=POSTER_PAGE_DEADLINE, thumbnails=None):
+    poster_urls = [PLACEHOLDER_POSTER] * len(titles)
+    for position, poster_url in iter_posters(titles, cache, deadline, thumbnails):
+        poster_urls[position] = poster_url
+    return poster_urls
@@ -0,0 +1,99 @@
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from engine import CATALOG_PATH, catalog_popularity, read_catalog
+from posters import (POSTER_WORKERS, PREFETCH_RATE, THUMBNAIL_DIR, THUMBNAIL_INDEX_PATH, RateLimiter, ThumbnailStore,
+                     get_session, prefetch_poster)
+
+# Poster thumbnails for the whole catalog, most popular titles first, so the
+# app serves them from static/thumbs/ instead of sending every browser to
+# TMDB for full-size images:
+#   python prefetch.py --rate 20
+# Stopping it (Ctrl-C) is safe; the next run skips every title already
+# stored and retries the ones that failed. Against the local TMDB stub:
+#   python -m tools.tmdb_stub --port 8765 &
+#   TMDB_SEARCH_URL=http://127.0.0.1:8765/3/search/movie \
+#   TMDB_IMAGE_URL=http://127.0.0.1:8765/t/p/w500 python prefetch.py
+
+# Progress is reported after this many titles
+REPORT_EVERY = 500
+
+def catalog_titles(catalog_path=CATALOG_PATH):
+    # Distinct titles, most popular first
+    movies_data = read_catalog(catalog_path, columns=['title', 'popularity'])
+    order = np.argsort(-catalog_popularity(movies_data), kind='stable')
+    return list(dict.fromkeys(movies_data['title'].astype(str).to_numpy()[order].tolist()))
+
+def prefetch(titles, store, rate=PREFETCH_RATE, workers=POSTER_WORKERS, report=None):
+    # Fetches every title the store doesn't have yet; returns the number of
+    # titles per outcome. At most a few lookups per worker are queued at
+    # once, so an interruption loses little.
+    done = store.stored_titles()
+    todo = [title for title in titles if title not in done]
+    outcomes = {'skipped': len(titles) - len(todo), 'stored': 0, 'missing': 0, 'error': 0}
+    limiter = RateLimiter(rate)
+    session = get_session()
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+    running = set()
+    next_report = outcomes['skipped'] + REPORT_EVERY
+
+    def collect(finished):
+        nonlocal next_report
+        for future in finished:
+            outcomes[future.result()] += 1
+        if report is not None and sum(outcomes.values()) >= next_report:
+            report(outcomes, len(titles))
+            next_report += REPORT_EVERY
+
+    try:
+        for title in todo:
+            if len(running) >= workers * 4:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                collect(finished)
+            running.add(executor.submit(prefetch_poster, title, store, limiter, session))
+        collect(wait(running).done)
+    finally:
+        # Lookups still queued are dropped on an interruption
+        executor.shutdown(wait=True, cancel_futures=True)
+    return outcomes
+
+def print_progress(outcomes, total):
+    print(f"{sum(outcomes.values())}/{total} titles: {outcomes}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download poster thumbnails for the whole catalog.")
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    parser.add_argument('--rate', type=float, default=PREFETCH_RATE, help="TMDB requests per second")
+    parser.add_argument('--workers', type=int, default=POSTER_WORKERS)
+    parser.add_argument('--limit', type=int, help="only the LIMIT most popular titles")
+    parser.add_argument('--thumbnails', default=THUMBNAIL_DIR, help="where thumbnail files are written")
+    parser.add_argument('--index', default=THUMBNAIL_INDEX_PATH, help="SQLite map of titles to thumbnails")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        raise SystemExit("Making thumbnails needs Pillow (pip install Pillow).")
+
+    started = time.perf_counter()
+    titles = catalog_titles(args.catalog)[:args.limit]
+    store = ThumbnailStore(args.thumbnails, args.index)
+    try:
+        outcomes = prefetch(titles, store, args.rate, args.workers, report=print_progress)
+    except KeyboardInterrupt:
+        print(f"Interrupted; {store.stats()['entries']} titles are stored, run again to resume.", file=sys.stderr)
+        return 130
+
+    print(f"Prefetched {len(titles)} titles in {time.perf_counter() - started:.1f}s: {outcomes}; "
+          f"store now {store.stats()}")
+    return 1 if outcomes['error'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
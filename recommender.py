@@ -1,15 +1,38 @@
 import streamlit as st
-import pandas as pd
-import requests
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import difflib
 import base64
+import logging
+import os
+import time
+import metrics
+from engine import (MODEL_DIR, ArtifactError, complete_title, get_profile_recommendations, get_recommendations,
+                    load_model)
+from posters import PosterCache, ThumbnailStore, iter_posters
+
+logger = logging.getLogger(__name__)
+
+# Stage timings and cache/HTTP counters under the results, also reachable
+# with ?diagnostics=1 in the URL
+SHOW_DIAGNOSTICS = os.environ.get('CINEMATCH_DIAGNOSTICS') == '1'
+# Title completions offered under the search box
+NUM_COMPLETIONS = 5
+# Top of the field weight sliders
+MAX_FIELD_WEIGHT = 3.0
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BANNER_PATH = os.path.join(APP_DIR, "static", "banner.jpg")
 
 def load_image_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode()
 
+@st.cache_resource
+def banner_url():
+    # Streamlit serves static/ itself when .streamlit/config.toml enables it;
+    # otherwise the banner is inlined, encoded once per process
+    if st.get_option("server.enableStaticServing"):
+        return "app/static/banner.jpg"
+    return f"data:image/jpeg;base64,{load_image_base64(BANNER_PATH)}"
+
 # Page configuration
 st.set_page_config(
     page_title="CineMatch - Find Your Next Movie",
@@ -17,7 +40,6 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="collapsed"
 )
-banner_base64 = load_image_base64("banner.jpg")
 
 # Professional Custom CSS
 st.markdown("""
@@ -484,7 +506,7 @@ st.markdown(f"""
     height: 500px;
     background:
         linear-gradient(rgba(0,0,0,0.55), rgba(0,0,0,0.75)),
-        url("data:image/jpeg;base64,{banner_base64}");
+        url("{banner_url()}");
     background-size: cover;
     background-position: center;
     display: flex;
@@ -496,74 +518,146 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 
-@st.cache_data
-def load_and_process_data():
+def model_stamp():
+    # Changes whenever `engine.py build` or `engine.py update` rewrites the
+    # artifact, so the next rerun maps the new one. The manifest's mtime
+    # rather than its catalog hash: a rebuild of the same CSV with other
+    # weights or engine keeps the hash.
     try:
-        movies_data = pd.read_csv('movies_preprocessed.csv')
-        selected_features = ['genres', 'keywords', 'tagline', 'cast', 'director']
-        
-        for feature in selected_features:
-            movies_data[feature] = movies_data[feature].fillna('')
-        
-        combined_features = (
-            movies_data['genres'] + ' ' + 
-            movies_data['keywords'] + ' ' + 
-            movies_data['tagline'] + ' ' + 
-            movies_data['cast'] + ' ' + 
-            movies_data['director']
-        )
-        
-        vectorizer = TfidfVectorizer()
-        feature_vectors = vectorizer.fit_transform(combined_features)
-        similarity = cosine_similarity(feature_vectors)
-        
-        return movies_data, similarity
+        return os.stat(os.path.join(MODEL_DIR, "manifest.json")).st_mtime_ns
+    except OSError:
+        return None
+
+@st.cache_resource(max_entries=1)
+def load_and_process_data(stamp=None):
+    # Maps the artifact written by `python engine.py build`
+    try:
+        return load_model()
     except FileNotFoundError:
         st.error("❌ movies.csv file not found. Please upload the dataset.")
         return None, None
+    except ArtifactError as e:
+        st.error(f"❌ {e}")
+        return None, None
 
-def fetch_poster(movie_title):
-    try:
-        search_url = f"https://api.themoviedb.org/3/search/movie?api_key=0b78123bc2f438d6b6d11c94f882d34b&query={movie_title}"
-        response = requests.get(search_url, timeout=5)
-        data = response.json()
-        
-        if data['results']:
-            poster_path = data['results'][0].get('poster_path')
-            if poster_path:
-                return f"https://image.tmdb.org/t/p/w500{poster_path}"
-        
-        return "https://via.placeholder.com/500x750?text=No+Poster"
-    except:
-        return "https://via.placeholder.com/500x750?text=No+Poster"
+@st.cache_resource
+def load_poster_cache():
+    # One SQLite-backed cache shared by every session
+    return PosterCache()
 
-def get_recommendations(movie_name, movies_data, similarity, num_recommendations=10):
-    try:
-        list_of_all_titles = movies_data['title'].tolist()
-        find_close_match = difflib.get_close_matches(movie_name, list_of_all_titles, n=1, cutoff=0.6)
-        
-        if not find_close_match:
-            return None, "Hmm, couldn't find that one. Try another movie title?"
-        
-        close_match = find_close_match[0]
-        index_of_the_movie = movies_data[movies_data['title'] == close_match].index[0]
-        similarity_score = list(enumerate(similarity[index_of_the_movie]))
-        sorted_similar_movies = sorted(similarity_score, key=lambda x: x[1], reverse=True)
+@st.cache_resource
+def load_thumbnail_store():
+    # Thumbnails written by `python prefetch.py`, served from app/static/.
+    # Without static serving the grid sticks to TMDB's own poster URLs.
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    return ThumbnailStore()
+
+def show_diagnostics(poster_cache, resolution_cache, thumbnails=None):
+    # Process-wide numbers: every session served by this server adds to them
+    with st.expander("Diagnostics"):
+        st.markdown("**Stage timings**")
+        st.table([{'stage': stage, **summary} for stage, summary in metrics.REGISTRY.stages().items()])
         
-        recommendations = []
-        for i, movie in enumerate(sorted_similar_movies[1:num_recommendations+1]):
-            index = movie[0]
-            title = movies_data.iloc[index]['title']
-            score = movie[1]
-            recommendations.append({
-                'title': title,
-                'similarity_score': score,
-                'rank': i + 1
-            })
+        counter_rows = []
+        for name in ('cinematch_title_matches_total', 'cinematch_title_resolutions_total',
+                     'cinematch_poster_lookups_total',
+                     'cinematch_tmdb_responses_total', 'cinematch_poster_deadline_misses_total'):
+            for labels, value in sorted(metrics.REGISTRY.counters(name).items()):
+                label_text = ", ".join(f"{key}={val}" for key, val in labels)
+                counter_rows.append({'counter': name, 'labels': label_text, 'value': value})
+        st.markdown("**Counters**")
+        st.table(counter_rows)
         
-        return recommendations, close_match
-    except Exception as e:
-        return None, f"Oops, something went wrong: {str(e)}"
+        resident, peak = metrics.memory_usage()
+        st.markdown("**Caches and memory**")
+        st.json({
+            'poster_cache': poster_cache.stats(),
+            'thumbnails': thumbnails.stats() if thumbnails is not None else None,
+            'resolution_cache': resolution_cache.stats(),
+            'resident_memory_mb': round(resident / (1 << 20), 1) if resident else None,
+            'peak_resident_memory_mb': round(peak / (1 << 20), 1) if peak else None
+        })
+
+def use_completion(title):
+    st.session_state['movie_search'] = title
+
+def show_completions(similarity, typed):
+    # Popular titles starting with what was typed; picking one fills the
+    # search box before the search runs
+    completions = [title for title in complete_title(similarity, typed, NUM_COMPLETIONS) if title != typed]
+    if not completions:
+        return
+    for i, (col, title) in enumerate(zip(st.columns(len(completions)), completions)):
+        with col:
+            st.button(title, key=f"completion_{i}", on_click=use_completion, args=(title,),
+                      use_container_width=True)
+
+def field_weight_sliders(similarity):
+    # How much each field counts for this session's searches. Left at the
+    # defaults, recommendations come straight from the neighbor index.
+    with st.expander("Fine-tune what counts"):
+        columns = st.columns(len(similarity['fields']))
+        return {
+            field: column.slider(
+                field.capitalize(),
+                min_value=0.0,
+                max_value=max(MAX_FIELD_WEIGHT, default),
+                value=float(default),
+                step=0.25,
+                key=f"weight_{field}"
+            )
+            for column, (field, default) in zip(columns, similarity['field_weights'].items())
+        }
+
+def facet_filters(similarity):
+    # Filters for this session's searches, in the form facet_mask() takes;
+    # empty when nothing is narrowed down
+    facets = similarity['facets']
+    first_year, last_year = facets.year_range()
+    with st.expander("Narrow it down"):
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            genres = st.multiselect("Genres", facets.genre_names, key="filter_genres")
+        with col2:
+            years = st.slider("Released", min_value=first_year, max_value=max(last_year, first_year + 1),
+                              value=(first_year, max(last_year, first_year + 1)), key="filter_years")
+        with col3:
+            languages = st.multiselect("Language", facets.language_names, key="filter_languages")
+
+    filters = {}
+    if genres:
+        filters['genres'] = genres
+    if languages:
+        filters['languages'] = languages
+    if years[0] > first_year:
+        filters['min_year'] = years[0]
+    if years[1] < last_year:
+        filters['max_year'] = years[1]
+    return filters
+
+def movie_card_html(rec, poster_url=None):
+    # Without a poster_url the card is drawn with an empty poster frame
+    match_percent = int(rec['similarity_score'] * 100)
+    poster_img = f'<img src="{poster_url}" alt="{rec["title"]}">' if poster_url else ''
+    
+    return f"""
+        <div class="movie-card">
+            <div class="movie-poster">
+                {poster_img}
+                <div class="movie-rank">#{rec['rank']}</div>
+            </div>
+            <div class="movie-info">
+                <div class="movie-title">{rec['title']}</div>
+                <div class="match-score">
+                    <div class="match-bar-container">
+                        <div class="match-bar" style="width: {match_percent}%"></div>
+                    </div>
+                    <div class="match-percentage">{match_percent}%</div>
+                </div>
+            </div>
+        </div>
+    """
 
 def main():
     # Banner Section
@@ -575,11 +669,13 @@ def main():
     """, unsafe_allow_html=True)
     
     # Load data
-    movies_data, similarity = load_and_process_data()
+    movies_data, similarity = load_and_process_data(model_stamp())
     
     if movies_data is None or similarity is None:
         st.stop()
     
+    poster_cache = load_poster_cache()
+    
     # Navigation Cards
     st.markdown("""
         <div class="nav-cards-container">
@@ -605,16 +701,46 @@ def main():
     st.markdown('<div class="search-section" id="search">', unsafe_allow_html=True)
     st.markdown('<h2 class="search-title">What movie do you like?</h2>', unsafe_allow_html=True)
     
-    # Using proper column ratios for better alignment
-    col1, col2, col3 = st.columns([3, 1.2, 1.2], vertical_alignment="bottom")
-    
-    with col1:
-        movie_input = st.text_input(
-            "movie",
-            placeholder="Type a movie you enjoyed... (like Inception or The Matrix)",
-            label_visibility="collapsed",
-            key="movie_search"
-        )
+    search_mode = st.radio(
+        "Search mode",
+        options=["One movie", "Several movies"],
+        horizontal=True,
+        label_visibility="collapsed",
+        key="search_mode"
+    )
+    
+    if search_mode == "One movie":
+        # Using proper column ratios for better alignment
+        col1, col2, col3 = st.columns([3, 1.2, 1.2], vertical_alignment="bottom")
+        
+        with col1:
+            movie_input = st.text_input(
+                "movie",
+                placeholder="Type a movie you enjoyed... (like Inception or The Matrix)",
+                label_visibility="collapsed",
+                key="movie_search"
+            )
+    else:
+        liked_col, disliked_col = st.columns(2)
+        
+        with liked_col:
+            liked_input = st.text_area(
+                "Movies you liked",
+                placeholder="One title per line",
+                key="liked_movies"
+            )
+        
+        with disliked_col:
+            disliked_input = st.text_area(
+                "Movies you didn't like (optional)",
+                placeholder="One title per line",
+                key="disliked_movies"
+            )
+        
+        col2, col3 = st.columns([1.2, 1.2], vertical_alignment="bottom")
+        liked_titles = [line.strip() for line in liked_input.splitlines() if line.strip()]
+        disliked_titles = [line.strip() for line in disliked_input.splitlines() if line.strip()]
+        movie_input = liked_titles
     
     with col2:
         num_recommendations = st.selectbox(
@@ -628,62 +754,90 @@ def main():
     with col3:
         search_button = st.button("Find Movies", use_container_width=True)
     
+    if search_mode == "One movie" and movie_input and not search_button:
+        show_completions(similarity, movie_input)
+    
+    weights = field_weight_sliders(similarity)
+    filters = facet_filters(similarity)
+    
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Results
     if search_button and movie_input:
+        search_started = time.perf_counter()
         with st.spinner("Looking through our collection..."):
-            recommendations, result = get_recommendations(
-                movie_input, 
-                movies_data, 
-                similarity, 
-                num_recommendations
-            )
+            if search_mode == "One movie":
+                recommendations, result = get_recommendations(
+                    movie_input, 
+                    movies_data, 
+                    similarity, 
+                    num_recommendations,
+                    weights,
+                    filters
+                )
+            else:
+                recommendations, result = get_profile_recommendations(
+                    liked_titles,
+                    disliked_titles,
+                    movies_data,
+                    similarity,
+                    num_recommendations,
+                    weights,
+                    filters
+                )
         
         if recommendations:
+            if isinstance(result, list):
+                liked_label = ", ".join(f'"{title}"' for title in result)
+            else:
+                liked_label = f'"{result}"'
             st.markdown(f"""
                 <div class="results-header">
-                    <div class="results-title">Because you liked "{result}"</div>
+                    <div class="results-title">Because you liked {liked_label}</div>
                     <div class="results-subtitle">Here are {len(recommendations)} movies you might enjoy</div>
                 </div>
             """, unsafe_allow_html=True)
             
             st.markdown('<div class="results-grid">', unsafe_allow_html=True)
             
+            # Lay every card out straight away, then fill in posters as they arrive
+            card_slots = []
             cols_per_row = 5
             for i in range(0, len(recommendations), cols_per_row):
                 cols = st.columns(cols_per_row)
                 for j, col in enumerate(cols):
                     if i + j < len(recommendations):
-                        rec = recommendations[i + j]
                         with col:
-                            poster_url = fetch_poster(rec['title'])
-                            match_percent = int(rec['similarity_score'] * 100)
-                            
-                            st.markdown(f"""
-                                <div class="movie-card">
-                                    <div class="movie-poster">
-                                        <img src="{poster_url}" alt="{rec['title']}">
-                                        <div class="movie-rank">#{rec['rank']}</div>
-                                    </div>
-                                    <div class="movie-info">
-                                        <div class="movie-title">{rec['title']}</div>
-                                        <div class="match-score">
-                                            <div class="match-bar-container">
-                                                <div class="match-bar" style="width: {match_percent}%"></div>
-                                            </div>
-                                            <div class="match-percentage">{match_percent}%</div>
-                                        </div>
-                                    </div>
-                                </div>
-                            """, unsafe_allow_html=True)
+                            slot = st.empty()
+                            slot.markdown(movie_card_html(recommendations[i + j]), unsafe_allow_html=True)
+                            card_slots.append(slot)
+            first_card_ms = (time.perf_counter() - search_started) * 1000
+            metrics.observe('cinematch_stage_seconds', first_card_ms / 1000, stage='page_first_card')
+            
+            titles = [rec['title'] for rec in recommendations]
+            for position, poster_url in iter_posters(titles, poster_cache, thumbnails=load_thumbnail_store()):
+                card_slots[position].markdown(
+                    movie_card_html(recommendations[position], poster_url),
+                    unsafe_allow_html=True
+                )
+            complete_ms = (time.perf_counter() - search_started) * 1000
+            metrics.observe('cinematch_stage_seconds', complete_ms / 1000, stage='page_complete')
+            logger.info(
+                "Results for %s: first card after %.0f ms, page complete after %.0f ms",
+                liked_label, first_card_ms, complete_ms
+            )
             
             st.markdown('</div>', unsafe_allow_html=True)
+        elif recommendations is not None:
+            st.info("No movies pass those filters. Try more genres, languages or years.")
         else:
             st.error(result)
     elif search_button:
         st.warning("⚠️ Type a movie name first!")
     
+    if SHOW_DIAGNOSTICS or st.query_params.get("diagnostics") == "1":
+        show_diagnostics(poster_cache, similarity['resolution_cache'], load_thumbnail_store())
+    
     # How It Works Section
     st.markdown("""
         <div class="how-it-works-section" id="how-it-works">
@@ -739,24 +893,37 @@ if __name__ == "__main__":
 # 1. PROJECT STRUCTURE:
 #    your_project_folder/
 #    ├── app.py (this file)
+#    ├── engine.py (model build and loading)
 #    ├── movies.csv (your dataset)
-#    └── banner.png (your banner image)
+#    ├── model/ (written by engine.py build)
+#    ├── .streamlit/config.toml (turns on static file serving)
+#    ├── static/banner.jpg (your banner image)
+#    └── static/thumbs/ (poster thumbnails written by prefetch.py)
 #
 # 2. BANNER IMAGE SETUP:
 #    - Find a movie-themed image
-#    - Save it as "banner.png" in the same folder as app.py
+#    - Save it as "banner.jpg" in the static folder next to app.py
 #
 # 3. INSTALL REQUIRED PACKAGES:
 #    Open terminal in VS Code and run:
-#    pip install streamlit pandas scikit-learn requests
+#    pip install streamlit pandas scikit-learn scipy requests
+#
+# 4. BUILD THE MODEL:
+#    python engine.py build
+#    After editing the dataset, apply just the edits with:
+#    python engine.py update
+#
+#    Optionally download poster thumbnails for the whole catalog, so the
+#    app serves them itself instead of linking full-size TMDB images:
+#    python prefetch.py
 #
-# 4. RUN THE APP:
+# 5. RUN THE APP:
 #    streamlit run app.py
 #
-# 5. REQUIREMENTS:
+# 6. REQUIREMENTS:
 #    - Python 3.7+
 #    - movies.csv with columns: title, genres, keywords, tagline, cast, director
-#    - banner.png image file
+#    - static/banner.jpg image file
 #    - TMDB API key (already included in code)
 #
 # ============================================
\ No newline at end of file
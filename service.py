@@ -0,0 +1,288 @@
+import argparse
+import bisect
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from engine import (CATALOG_PATH, MODEL_DIR, complete_title, facet_mask, field_weights, load_model, match_title,
+                    not_found_message, parse_field_weights, recommend, recommend_for_profile)
+from title_index import MAX_COMPLETIONS
+
+# Headless JSON API over the same model as the Streamlit app, without
+# importing Streamlit:
+#   python service.py --port 8000
+#   GET /recommend?title=Inception&k=10
+#   GET /recommend?title=Inception&weights=director=2,tagline=0.5
+#   GET /recommend?title=Inception&genre=Comedy&genre=Drama&language=en&min_year=2000
+#   GET /recommend/profile?liked=Inception&liked=Heat&disliked=Cars&k=10
+#   GET /suggest?q=inc&n=5   (title completions, for as-you-type search boxes)
+#   GET /healthz
+#   GET /metrics           (Prometheus text format)
+#   GET /metrics/latency
+
+logger = logging.getLogger(__name__)
+
+MAX_RECOMMENDATIONS = 100
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, route, seconds):
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            series = self._series.setdefault(route, {
+                'counts': [0] * (len(self.buckets_ms) + 1),
+                'count': 0,
+                'sum_ms': 0.0
+            })
+            series['counts'][bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+            series['count'] += 1
+            series['sum_ms'] += elapsed_ms
+
+    def snapshot(self):
+        # Cumulative counts per bucket, like a Prometheus histogram
+        with self._lock:
+            snapshot = {}
+            for route, series in self._series.items():
+                cumulative, buckets = 0, []
+                for bound, count in zip(self.buckets_ms + ['+Inf'], series['counts']):
+                    cumulative += count
+                    buckets.append({'le_ms': bound, 'count': cumulative})
+                snapshot[route] = {
+                    'buckets': buckets,
+                    'count': series['count'],
+                    'sum_ms': round(series['sum_ms'], 3)
+                }
+            return snapshot
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    # Every connection gets a thread, which mostly waits on the socket; at
+    # most workers requests are handled at once. A keep-alive connection
+    # holds one of those slots only while a request on it is being handled,
+    # so idle clients can't starve the others.
+    daemon_threads = True
+
+    def __init__(self, address, handler, movies_data, similarity, workers):
+        super().__init__(address, handler)
+        self.movies_data = movies_data
+        self.similarity = similarity
+        self.latency = LatencyHistogram()
+        self.started_at = time.time()
+        self.slots = threading.BoundedSemaphore(workers)
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections are closed after this long
+    timeout = 30
+    # Headers and body are separate writes; with Nagle's algorithm the body
+    # waits for the client's delayed ACK, 40ms per keep-alive request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        started = time.perf_counter()
+        self.status = None
+        url = urlparse(self.path)
+        routes = {
+            '/recommend': self.handle_recommend,
+            '/recommend/profile': self.handle_profile,
+            '/suggest': self.handle_suggest,
+            '/healthz': self.handle_healthz,
+            '/metrics': self.handle_metrics,
+            '/metrics/latency': self.handle_latency
+        }
+        route = url.path if url.path in routes else 'unknown'
+        try:
+            # Time spent waiting for a free slot counts in the latency
+            with self.server.slots:
+                if route == 'unknown':
+                    self.send_json(404, {'error': f"No route for {url.path}"})
+                else:
+                    routes[route](parse_qs(url.query))
+        except Exception:
+            logger.exception("Request %s failed", self.path)
+            self.send_json(500, {'error': "Internal error"})
+        finally:
+            self.server.latency.observe(route, time.perf_counter() - started)
+            metrics.count('cinematch_http_requests_total', route=route, status=str(self.status))
+
+    def read_k(self, query):
+        # None (after answering 400) when k is missing the valid range
+        try:
+            k = int(query.get('k', ['10'])[0])
+        except ValueError:
+            k = 0
+        if not 1 <= k <= MAX_RECOMMENDATIONS:
+            self.send_json(400, {'error': f"'k' must be an integer from 1 to {MAX_RECOMMENDATIONS}"})
+            return None
+        return k
+
+    def read_weights(self, query):
+        # (ok, field weight overrides); answers 400 when they don't parse
+        try:
+            weights = parse_field_weights(query.get('weights', [''])[0])
+            field_weights(self.server.similarity, weights)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return False, None
+        return True, weights
+
+    def read_filters(self, query):
+        # (ok, facet filters for facet_mask()); answers 400 when they don't parse
+        filters = {}
+        for name, key in (('genres', 'genre'), ('languages', 'language')):
+            values = [value.strip() for value in query.get(key, []) if value.strip()]
+            if values:
+                filters[name] = values
+        try:
+            for key in ('min_year', 'max_year'):
+                if key in query:
+                    try:
+                        filters[key] = int(query[key][0])
+                    except ValueError:
+                        raise ValueError(f"'{key}' must be a year")
+            facet_mask(self.server.similarity, filters)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return False, None
+        return True, filters
+
+    def handle_recommend(self, query):
+        title = query.get('title', [''])[0].strip()
+        if not title:
+            self.send_json(400, {'error': "Missing 'title' parameter"})
+            return
+        k = self.read_k(query)
+        if k is None:
+            return
+        ok, weights = self.read_weights(query)
+        if not ok:
+            return
+        ok, filters = self.read_filters(query)
+        if not ok:
+            return
+
+        movies_data, similarity = self.server.movies_data, self.server.similarity
+        movie_index = match_title(similarity, title)
+        if movie_index is None:
+            self.send_json(404, {'error': not_found_message(title, similarity)})
+            return
+
+        self.send_json(200, {
+            'query': title,
+            'match': similarity['title_index'].titles[movie_index],
+            'recommendations': recommend(movies_data, similarity, movie_index, k, weights, filters)
+        })
+
+    def handle_profile(self, query):
+        liked = [title.strip() for title in query.get('liked', []) if title.strip()]
+        disliked = [title.strip() for title in query.get('disliked', []) if title.strip()]
+        if not liked:
+            self.send_json(400, {'error': "Give at least one 'liked' title"})
+            return
+        k = self.read_k(query)
+        if k is None:
+            return
+        ok, weights = self.read_weights(query)
+        if not ok:
+            return
+        ok, filters = self.read_filters(query)
+        if not ok:
+            return
+
+        movies_data, similarity = self.server.movies_data, self.server.similarity
+        rows = {}
+        for title in liked + disliked:
+            rows[title] = match_title(similarity, title)
+            if rows[title] is None:
+                self.send_json(404, {'error': not_found_message(title, similarity, name_it=True)})
+                return
+
+        liked_rows = list(dict.fromkeys(rows[title] for title in liked))
+        disliked_rows = [row for row in dict.fromkeys(rows[title] for title in disliked) if row not in liked_rows]
+        self.send_json(200, {
+            'liked': similarity['title_index'].titles.take(liked_rows),
+            'disliked': similarity['title_index'].titles.take(disliked_rows),
+            'recommendations': recommend_for_profile(
+                movies_data, similarity, liked_rows, disliked_rows, k, weights=weights, filters=filters
+            )
+        })
+
+    def handle_suggest(self, query):
+        # Unlike the other routes the prefix is not stripped: a trailing
+        # space means the last word is complete
+        prefix = query.get('q', [''])[0]
+        try:
+            n = int(query.get('n', ['5'])[0])
+        except ValueError:
+            n = 0
+        if not 1 <= n <= MAX_COMPLETIONS:
+            self.send_json(400, {'error': f"'n' must be an integer from 1 to {MAX_COMPLETIONS}"})
+            return
+
+        self.send_json(200, {'query': prefix, 'suggestions': complete_title(self.server.similarity, prefix, n)})
+
+    def handle_healthz(self, query):
+        self.send_json(200, {
+            'status': 'ok',
+            'movies': len(self.server.movies_data),
+            'resolution_cache': self.server.similarity['resolution_cache'].stats(),
+            'uptime_seconds': round(time.time() - self.server.started_at, 1)
+        })
+
+    def handle_latency(self, query):
+        self.send_json(200, self.server.latency.snapshot())
+
+    def handle_metrics(self, query):
+        self.send_body(200, metrics.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload).encode(), 'application/json')
+
+    def send_body(self, status, body, content_type):
+        self.status = status
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+def create_server(host='127.0.0.1', port=8000, workers=8, model_dir=MODEL_DIR, catalog_path=CATALOG_PATH):
+    # The model is loaded once and shared by every worker thread
+    movies_data, similarity = load_model(model_dir, catalog_path)
+    return BoundedHTTPServer((host, port), RecommendationHandler, movies_data, similarity, workers)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve CineMatch recommendations as JSON.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--model', default=MODEL_DIR)
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = create_server(args.host, args.port, args.workers, args.model, args.catalog)
+    logger.info("Serving %d movies on http://%s:%d", len(server.movies_data), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.synth_catalog import generate_catalog  # noqa: E402
+from tools.tmdb_stub import start_stub  # noqa: E402
+
+# Movies in the synthetic test catalog
+NUM_MOVIES = 600
+
+@pytest.fixture(scope='session')
+def catalog_path(tmp_path_factory):
+    # A small synthetic catalog with some fields left empty, as in the real
+    # one, and a run of genre-only movies whose scores tie exactly
+    catalog = generate_catalog(NUM_MOVIES, seed=7)
+    catalog.loc[::7, 'tagline'] = ''
+    catalog.loc[::11, 'keywords'] = ''
+    ties = catalog.index[-40:]
+    catalog.loc[ties, ['keywords', 'tagline', 'cast', 'director']] = ''
+    catalog.loc[ties, 'genres'] = 'Drama Comedy'
+    path = tmp_path_factory.mktemp('catalog') / 'movies.csv'
+    catalog.to_csv(path, index=False)
+    return str(path)
+
+@pytest.fixture(scope='session')
+def model(catalog_path):
+    from engine import build_model
+
+    return build_model(catalog_path)
+
+@pytest.fixture(scope='session')
+def model_dir(catalog_path, model, tmp_path_factory):
+    from engine import save_model
+
+    movies_data, similarity = model
+    directory = str(tmp_path_factory.mktemp('model') / 'model')
+    save_model(movies_data, similarity, catalog_path, directory)
+    return directory
+
+@pytest.fixture
+def tmdb(monkeypatch):
+    # Starts a local TMDB stub with the given settings and points the poster
+    # code at it; every stub started is shut down after the test
+    import posters
+
+    servers = []
+
+    def start(**settings):
+        server = start_stub(**settings)
+        servers.append(server)
+        monkeypatch.setattr(posters, 'TMDB_SEARCH_URL', server.search_url)
+        monkeypatch.setattr(posters, 'TMDB_IMAGE_URL', server.image_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
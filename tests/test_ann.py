@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from ann import ImpactIndex
+from engine import SELECTED_FEATURES, build_ann_neighbor_index, index_vectors, top_k_matches
+
+@pytest.fixture(scope='session')
+def ann_neighbors(model):
+    _, similarity = model
+    weights = [similarity['field_weights'][feature] for feature in SELECTED_FEATURES]
+    # Postings cut well below the catalog size, so candidates are missed
+    ann = ImpactIndex(postings_per_term=50).fit(similarity['inverted_index'])
+    vectors = index_vectors(similarity['feature_vectors'], similarity['field_offsets'], weights)
+    neighbor_ids, neighbor_scores = build_ann_neighbor_index(
+        similarity['feature_vectors'], ann, similarity['field_offsets'], weights, block_rows=64
+    )
+    return ann, vectors, neighbor_ids, neighbor_scores
+
+def test_ann_recall_against_exact_index(model, ann_neighbors):
+    _, similarity = model
+    _, _, neighbor_ids, _ = ann_neighbors
+    exact = similarity['neighbor_ids'][:, :11]
+    found = [len(np.intersect1d(ids, expected)) for ids, expected in zip(neighbor_ids[:, :11], exact)]
+    assert np.mean(found) / 11 >= 0.95
+
+def test_ann_lists_start_with_the_movie_itself(ann_neighbors):
+    # Or with an identical movie tied with it
+    _, _, neighbor_ids, neighbor_scores = ann_neighbors
+    rows = np.arange(len(neighbor_ids))
+    itself = neighbor_ids[:, 0] == rows
+    np.testing.assert_allclose(neighbor_scores[~itself, 0], 1.0, rtol=1e-6)
+    assert itself.mean() > 0.9
+
+def test_blocked_ann_build_matches_single_queries(ann_neighbors):
+    ann, vectors, neighbor_ids, neighbor_scores = ann_neighbors
+    for row in range(0, vectors.shape[0], 7):
+        ids, scores = top_k_matches(ann.score_candidates(vectors, vectors[row]), neighbor_ids.shape[1])
+        np.testing.assert_array_equal(ids, neighbor_ids[row])
+        np.testing.assert_array_equal(scores, neighbor_scores[row])
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+from engine import load_model, read_manifest, save_model
+
+def versions(model_dir):
+    parent = os.path.dirname(model_dir)
+    return sorted(name for name in os.listdir(parent) if name.startswith(os.path.basename(model_dir) + '.v'))
+
+def test_saves_switch_a_link_to_the_new_version(model, catalog_path, tmp_path):
+    movies_data, similarity = model
+    model_dir = str(tmp_path / 'model')
+    for _ in range(3):
+        save_model(movies_data, similarity, catalog_path, model_dir)
+    assert os.path.islink(model_dir)
+    # The version before the current one stays for readers still loading it
+    kept = versions(model_dir)
+    assert len(kept) == 2
+    assert os.readlink(model_dir) == kept[-1]
+    assert not any(name.startswith('model.tmp-') for name in os.listdir(tmp_path))
+
+    for version in kept:
+        _, loaded = load_model(str(tmp_path / version), catalog_path)
+        np.testing.assert_array_equal(loaded['neighbor_ids'], similarity['neighbor_ids'])
+
+def test_plain_model_directory_is_replaced(model, catalog_path, tmp_path):
+    # An artifact saved before versioned builds is a plain directory
+    movies_data, similarity = model
+    model_dir = str(tmp_path / 'model')
+    save_model(movies_data, similarity, catalog_path, model_dir)
+    os.rename(os.path.realpath(model_dir), str(tmp_path / 'plain'))
+    os.remove(model_dir)
+    os.rename(str(tmp_path / 'plain'), model_dir)
+
+    save_model(movies_data, similarity, catalog_path, model_dir + os.sep)
+    assert os.path.islink(model_dir)
+    assert read_manifest(model_dir)['num_movies'] == len(movies_data)
+    load_model(model_dir, catalog_path)
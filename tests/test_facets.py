@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import NEIGHBOR_K, facet_mask, query_similar, recommend
+from facets import split_genres
+
+FILTERS = {'genres': ['drama', 'Science Fiction'], 'languages': ['EN', 'fr'], 'min_year': 1990, 'max_year': 2015}
+
+def expected_mask(catalog_path, genres, languages, min_year, max_year):
+    catalog = pd.read_csv(catalog_path, dtype=str, keep_default_na=False)
+    wanted = {genre.lower() for genre in genres}
+    in_genres = catalog['genres'].map(lambda text: any(genre.lower() in wanted for genre in split_genres(text)))
+    in_languages = catalog['original_language'].str.lower().isin([language.lower() for language in languages])
+    years = catalog['release_date'].str[:4].astype(int)
+    return (in_genres & in_languages & (years >= min_year) & (years <= max_year)).to_numpy()
+
+def test_facet_mask_combines_filters(model, catalog_path):
+    _, similarity = model
+    allowed = facet_mask(similarity, FILTERS)
+    np.testing.assert_array_equal(allowed, expected_mask(catalog_path, **FILTERS))
+    assert 0 < allowed.sum() < len(allowed)
+    assert facet_mask(similarity, {}) is None
+    with pytest.raises(ValueError):
+        facet_mask(similarity, {'genres': ['Nope']})
+
+@pytest.mark.parametrize('k', [5, NEIGHBOR_K + 5])
+def test_filtered_lists_are_the_full_ranking_filtered(model, k):
+    # Whether the index answers or the catalog is scored under the mask,
+    # a filtered list is the unfiltered ranking with the others left out
+    movies_data, similarity = model
+    allowed = facet_mask(similarity, FILTERS)
+    titles = similarity['title_index'].titles
+    for row in range(0, len(movies_data), 7):
+        ids, scores = query_similar(similarity, row, len(movies_data), exclude=[row])
+        passing = allowed[ids]
+        expected = list(zip(titles.take(ids[passing][:k]), scores[passing][:k].tolist()))
+        recommended = recommend(movies_data, similarity, row, k, filters=FILTERS)
+        assert [(rec['title'], rec['similarity_score']) for rec in recommended] == expected
+
+@pytest.mark.parametrize('k', [10, NEIGHBOR_K + 5])
+def test_filter_passing_everything_changes_nothing(model, k):
+    movies_data, similarity = model
+    first, last = similarity['facets'].year_range()
+    everything = {'min_year': first, 'max_year': last}
+    assert facet_mask(similarity, everything).all()
+    # Every 9th movie, and all the identical ones at the end of the catalog
+    rows = list(range(0, len(movies_data) - 40, 9)) + list(range(len(movies_data) - 40, len(movies_data)))
+    for row in rows:
+        assert (recommend(movies_data, similarity, row, k, filters=everything)
+                == recommend(movies_data, similarity, row, k))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from engine import (NEIGHBOR_K, SELECTED_FEATURES, build_neighbor_index, index_vectors, patch_neighbor_index,
+                    recommend)
+
+@pytest.fixture(scope='session')
+def vectors(model):
+    _, similarity = model
+    weights = [similarity['field_weights'][feature] for feature in SELECTED_FEATURES]
+    return index_vectors(similarity['feature_vectors'], similarity['field_offsets'], weights)
+
+def brute_force_neighbors(vectors, width):
+    # Dense all-pairs scores ranked in float32, ties in catalog order
+    scores = (vectors @ vectors.T).toarray().astype(np.float32)
+    ids = np.argsort(-scores, axis=1, kind='stable')[:, :width]
+    return ids, np.take_along_axis(scores, ids, axis=1)
+
+@pytest.mark.parametrize('workers, memory_mb', [(1, 1024), (2, 64), (1, 8), (1, 1)])
+def test_blocked_build_matches_brute_force(vectors, workers, memory_mb):
+    expected_ids, expected_scores = brute_force_neighbors(vectors, NEIGHBOR_K + 1)
+    neighbor_ids, neighbor_scores = build_neighbor_index(vectors, workers=workers, memory_mb=memory_mb)
+    np.testing.assert_array_equal(neighbor_ids, expected_ids)
+    np.testing.assert_allclose(neighbor_scores, expected_scores, rtol=1e-6)
+    # The catalog's last 40 movies are identical, so each lists all of them
+    # first, in catalog order
+    first = vectors.shape[0] - 40
+    np.testing.assert_array_equal(neighbor_ids[first:, :40], np.tile(np.arange(first, first + 40), (40, 1)))
+
+def test_patched_index_matches_full_build(vectors):
+    # An update changes some movies, three of the identical ones among them;
+    # the old lists patched with the changed rows must equal a full build
+    num_movies = vectors.shape[0]
+    first = num_movies - 40
+    dirty_rows = np.union1d(np.arange(0, first, 37), [first + 5, first + 17, num_movies - 1])
+    old_vectors = vectors.tolil()
+    old_vectors[dirty_rows] = vectors[(dirty_rows * 7 + 1) % first]
+    old_ids, old_scores = build_neighbor_index(old_vectors.tocsr())
+
+    kept_rows = np.setdiff1d(np.arange(num_movies), dirty_rows)
+    kept_ids = np.where(np.isin(old_ids[kept_rows], dirty_rows), -1, old_ids[kept_rows])
+    neighbor_ids, neighbor_scores, relisted, merged = patch_neighbor_index(
+        vectors, kept_ids, old_scores[kept_rows], kept_rows, dirty_rows
+    )
+    assert merged > 0
+    expected_ids, expected_scores = build_neighbor_index(vectors)
+    np.testing.assert_array_equal(neighbor_ids, expected_ids)
+    np.testing.assert_array_equal(neighbor_scores, expected_scores)
+
+@pytest.mark.parametrize('k', [10, NEIGHBOR_K + 5])
+def test_duplicates_are_not_recommended_to_themselves(model, k):
+    # Each of the 40 identical movies gets the other 39 first, in catalog
+    # order, however they tie with it; k picks the index or the query path
+    movies_data, similarity = model
+    titles = similarity['title_index'].titles
+    first = len(movies_data) - 40
+    for row in range(first, len(movies_data)):
+        recommended = [rec['title'] for rec in recommend(movies_data, similarity, row, k)]
+        twins = [titles[twin] for twin in range(first, len(movies_data)) if twin != row]
+        assert len(recommended) == k
+        assert titles[row] not in recommended
+        assert recommended[:min(k, 39)] == twins[:k]
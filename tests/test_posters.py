@@ -0,0 +1,43 @@
+import time
+
+from posters import PLACEHOLDER_POSTER, PosterCache, fetch_poster, fetch_posters, iter_posters
+
+def test_fetch_poster_caches_found_and_missing(tmdb, tmp_path):
+    stub = tmdb(missing_rate=0.5)
+    cache = PosterCache(str(tmp_path / "posters.sqlite3"))
+    titles = [f"Movie {i}" for i in range(10)]
+    first = [fetch_poster(title, cache) for title in titles]
+    assert any(url == PLACEHOLDER_POSTER for url in first)
+    assert any(url.startswith(stub.image_url) for url in first)
+
+    requests = stub.requests
+    assert [fetch_poster(title, cache) for title in titles] == first
+    assert stub.requests == requests
+    assert cache.counters['negative_hits'] == first.count(PLACEHOLDER_POSTER)
+
+def test_failed_lookups_are_not_cached(tmdb, tmp_path):
+    stub = tmdb(error_rate=1.0)
+    cache = PosterCache(str(tmp_path / "posters.sqlite3"))
+    assert fetch_poster("Movie", cache) == PLACEHOLDER_POSTER
+    assert cache.get("Movie") == (False, None)
+    assert stub.requests == 1
+
+def test_missed_deadline_drops_queued_lookups(tmdb, tmp_path):
+    # A slow page times out with most of its lookups still queued on the
+    # shared pool; the next page must not wait behind them
+    tmdb(latency=0.3, missing_rate=0.0)
+    cache = PosterCache(str(tmp_path / "posters.sqlite3"))
+    slow_page = fetch_posters([f"Slow {i}" for i in range(40)], cache, deadline=0.1)
+    assert slow_page.count(PLACEHOLDER_POSTER) == 40
+
+    started = time.perf_counter()
+    next_page = fetch_posters([f"Next {i}" for i in range(8)], cache, deadline=1.0)
+    assert PLACEHOLDER_POSTER not in next_page
+    assert time.perf_counter() - started < 1.0
+
+def test_iter_posters_yields_every_position(tmdb, tmp_path):
+    tmdb(missing_rate=0.0)
+    titles = [f"Movie {i}" for i in range(12)]
+    results = dict(iter_posters(titles, PosterCache(str(tmp_path / "posters.sqlite3"))))
+    assert sorted(results) == list(range(12))
+    assert PLACEHOLDER_POSTER not in results.values()
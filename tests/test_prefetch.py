@@ -0,0 +1,60 @@
+import time
+
+from posters import PLACEHOLDER_POSTER, PosterCache, ThumbnailStore, iter_posters
+from prefetch import prefetch
+
+TITLES = [f"Movie {i}" for i in range(12)]
+
+def thumbnail_store(tmp_path):
+    return ThumbnailStore(str(tmp_path / "thumbs"), str(tmp_path / "thumbs.sqlite3"), "static/thumbs")
+
+def test_rerun_skips_stored_titles(tmdb, tmp_path):
+    stub = tmdb()
+    store = thumbnail_store(tmp_path)
+    first = prefetch(TITLES[:5], store, rate=1000, workers=4)
+    assert first['skipped'] == 0 and first['error'] == 0
+    assert first['stored'] + first['missing'] == 5
+
+    requests = stub.requests
+    second = prefetch(TITLES, store, rate=1000, workers=4)
+    assert second['skipped'] == 5 and second['error'] == 0
+    assert second['stored'] + second['missing'] == len(TITLES) - 5
+    assert store.stored_titles() == set(TITLES)
+    # Only the new titles were looked up: a search each, plus a download
+    # for the ones with a poster
+    assert stub.requests - requests == len(TITLES) - 5 + second['stored']
+
+def test_missing_posters_are_recorded(tmdb, tmp_path):
+    stub = tmdb(missing_rate=1.0)
+    store = thumbnail_store(tmp_path)
+    assert prefetch(TITLES, store, rate=1000, workers=4)['missing'] == len(TITLES)
+    assert all(store.get(title) == (True, None) for title in TITLES)
+
+    requests = stub.requests
+    assert prefetch(TITLES, store, rate=1000, workers=4)['skipped'] == len(TITLES)
+    assert stub.requests == requests
+
+def test_rate_limited_lookups_wait_and_retry(tmdb, tmp_path):
+    stub = tmdb(missing_rate=1.0, rate_limit=3)
+    store = thumbnail_store(tmp_path)
+    started = time.perf_counter()
+    outcomes = prefetch(TITLES[:6], store, rate=1000, workers=6)
+    assert stub.limited > 0
+    assert outcomes['missing'] == 6 and outcomes['error'] == 0
+    # The stub answers a 429 with Retry-After: 1
+    assert time.perf_counter() - started >= 1.0
+
+def test_iter_posters_serves_local_thumbnails(tmdb, tmp_path):
+    stub = tmdb(missing_rate=0.0)
+    store = thumbnail_store(tmp_path)
+    assert prefetch(TITLES[:4], store, rate=1000, workers=4)['stored'] == 4
+    store.put(TITLES[4], None)
+
+    requests = stub.requests
+    cache = PosterCache(str(tmp_path / "posters.sqlite3"))
+    results = dict(iter_posters(TITLES[:6], cache, thumbnails=store))
+    assert all(results[position].startswith("static/thumbs/") for position in range(4))
+    assert results[4] == PLACEHOLDER_POSTER
+    assert results[5].startswith(stub.image_url)
+    # Only the title without a thumbnail went to TMDB
+    assert stub.requests - requests == 1
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from engine import (NEIGHBOR_K, facet_mask, field_weights, profile_vector, query_similar, recommend,
+                    recommend_for_profile, recommend_many, score_catalog)
+
+def recommendation_pairs(recommendations):
+    return [(rec['title'], rec['similarity_score']) for rec in recommendations]
+
+def test_query_path_matches_neighbor_index(model):
+    # Scoring one movie against the whole catalog gives its neighbor list,
+    # ids, scores and the order of ties included
+    _, similarity = model
+    width = similarity['neighbor_ids'].shape[1]
+    for row in range(similarity['neighbor_ids'].shape[0]):
+        ids, scores = query_similar(similarity, row, width)
+        np.testing.assert_array_equal(ids, similarity['neighbor_ids'][row])
+        np.testing.assert_array_equal(scores, similarity['neighbor_scores'][row])
+
+def test_longer_lists_extend_indexed_ones(model):
+    # Lists past NEIGHBOR_K come from the query path; the ones the index
+    # answers must be their prefix
+    movies_data, similarity = model
+    for row in range(0, len(movies_data), 5):
+        short = recommend(movies_data, similarity, row, NEIGHBOR_K - 1)
+        long = recommend(movies_data, similarity, row, NEIGHBOR_K + 10)
+        assert recommendation_pairs(short) == recommendation_pairs(long)[:NEIGHBOR_K - 1]
+
+def test_recommend_many_matches_recommend(model):
+    movies_data, similarity = model
+    rows = np.arange(0, len(movies_data), 5)
+    k = NEIGHBOR_K + 10
+    for block, block_ids, block_scores in recommend_many(similarity, rows, k):
+        for row, ids, scores in zip(block, block_ids, block_scores):
+            expected_ids, expected_scores = query_similar(similarity, row, k, exclude=[row])
+            np.testing.assert_array_equal(ids, expected_ids)
+            np.testing.assert_array_equal(scores, expected_scores)
+
+@pytest.mark.parametrize('k', [10, NEIGHBOR_K + 5])
+def test_recommend_many_leaves_out_duplicate_seeds(model, k):
+    # The 40 identical movies at the end of the catalog tie with each other;
+    # batch lists must match recommend()'s, the seed left out of each
+    movies_data, similarity = model
+    rows = np.arange(len(movies_data) - 40, len(movies_data))
+    titles = similarity['title_index'].titles
+    for block, block_ids, block_scores in recommend_many(similarity, rows, k, block_rows=16):
+        for row, ids, scores in zip(block, block_ids, block_scores):
+            assert row not in ids
+            expected = recommendation_pairs(recommend(movies_data, similarity, row, k))
+            assert list(zip(titles.take(ids), scores.tolist())) == expected
+
+def test_reweighted_paths_agree(model):
+    movies_data, similarity = model
+    weights = field_weights(similarity, {'director': 3.0, 'tagline': 0.0})
+    rows = np.arange(0, len(movies_data), 9)
+    for block, block_ids, block_scores in recommend_many(dict(similarity, field_weights=weights), rows, 20):
+        for row, ids, scores in zip(block, block_ids, block_scores):
+            expected_ids, expected_scores = query_similar(similarity, row, 20, weights, exclude=[row])
+            np.testing.assert_array_equal(ids, expected_ids)
+            np.testing.assert_array_equal(scores, expected_scores)
+
+def test_empty_fields_do_not_cap_similarity(model):
+    # A movie without a tagline or keywords is still fully similar to
+    # itself, and an identical movie scores 1 with it
+    movies_data, similarity = model
+    np.testing.assert_allclose(similarity['neighbor_scores'][:, 0], 1.0, rtol=1e-6)
+    # The catalog ends with 40 genre-only movies with the same genres
+    first = len(movies_data) - 40
+    ids, scores = query_similar(similarity, first, 3)
+    np.testing.assert_array_equal(ids, [first, first + 1, first + 2])
+    np.testing.assert_allclose(scores, 1.0, rtol=1e-6)
+
+@pytest.mark.parametrize('filters', [None, {'languages': ['en']}])
+def test_disliked_titles_do_not_shorten_lists(model, filters):
+    # Disliking a genre-only movie pushes many scores below zero; asked for
+    # every movie left, the list still has them all, those last at 0
+    movies_data, similarity = model
+    liked, disliked = [0], [len(movies_data) - 1]
+    scores = score_catalog(similarity, profile_vector(similarity, liked, disliked, 1.0), field_weights(similarity))
+    assert (scores.data < 0).any()
+
+    allowed = facet_mask(similarity, filters)
+    candidates = np.ones(len(movies_data), dtype=bool) if allowed is None else allowed.copy()
+    candidates[liked + disliked] = False
+    k = int(candidates.sum())
+    recommended = recommend_for_profile(movies_data, similarity, liked, disliked, k, 1.0, filters=filters)
+    assert len(recommended) == k
+    titles = similarity['title_index'].titles
+    assert sorted(rec['title'] for rec in recommended) == sorted(titles.take(np.flatnonzero(candidates)))
+    assert min(rec['similarity_score'] for rec in recommended) == 0
@@ -0,0 +1,36 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from service import create_server
+
+@pytest.fixture
+def server(model_dir, catalog_path):
+    server = create_server(port=0, workers=2, model_dir=model_dir, catalog_path=catalog_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def get(connection, path):
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+def test_idle_keep_alive_connections_leave_workers_free(server):
+    # More idle keep-alive clients than workers, then one more request
+    port = server.server_address[1]
+    title = server.movies_data['title'].iloc[0]
+    idle = [http.client.HTTPConnection('127.0.0.1', port, timeout=5) for _ in range(3)]
+    for connection in idle:
+        assert get(connection, '/healthz')[0] == 200
+
+    fresh = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+    status, body = get(fresh, f"/recommend?title={title.replace(' ', '+')}&k=3")
+    assert status == 200
+    assert len(body['recommendations']) == 3
+    for connection in idle + [fresh]:
+        connection.close()
@@ -0,0 +1,74 @@
+import difflib
+import random
+import string
+
+import pytest
+
+from engine import match_title
+from title_index import ResolutionCache, TitleIndex, normalize_title
+
+def test_exact_titles_resolve_past_the_cache():
+    # "HEAT!" normalizes like "Heat", but typed exactly it is its own movie
+    title_index = TitleIndex(["Heat", "HEAT!", "Heat Wave"])
+    cache = ResolutionCache(title_index)
+    cache.warm(range(3))
+    similarity = {'resolution_cache': cache}
+    assert match_title(similarity, "HEAT!") == 1
+    assert match_title(similarity, "Heat") == 0
+    assert title_index.match("HEAT!") == [(1, 1.0)]
+    # Anything else typed still goes through the cache
+    assert cache.resolve("heat")[0] == 0
+    assert cache.resolve("heat")[1]
+
+def typo(title, rng):
+    # One or two dropped, replaced or swapped letters in the lowercased title
+    typed = list(title.lower())
+    for _ in range(rng.randint(1, 2)):
+        position = rng.randrange(len(typed))
+        edit = rng.random()
+        if edit < 0.4 and len(typed) > 3:
+            del typed[position]
+        elif edit < 0.7:
+            typed[position] = rng.choice(string.ascii_lowercase)
+        elif position + 1 < len(typed):
+            typed[position], typed[position + 1] = typed[position + 1], typed[position]
+    return ''.join(typed)
+
+@pytest.fixture(scope='module')
+def typo_queries(model):
+    _, similarity = model
+    titles = list(similarity['title_index'].titles)
+    rng = random.Random(0)
+    return [typo(title, rng) for title in rng.sample(titles, 150)]
+
+def test_trigram_matcher_agrees_with_difflib(model, typo_queries):
+    # match() is difflib.get_close_matches over the normalized titles, with
+    # the trigram index only narrowing down which titles are rescored
+    _, similarity = model
+    title_index = similarity['title_index']
+    normalized = list(title_index.normalized)
+    for query in typo_queries:
+        expected = difflib.get_close_matches(normalize_title(query), normalized, n=1, cutoff=0.6)
+        matched = [title_index.normalized[row] for row, _ in title_index.match(query)]
+        assert matched == expected, query
+
+def test_differences_from_plain_difflib_are_better_matches(model, typo_queries):
+    # Against the raw titles difflib also counts case and punctuation, which
+    # match() ignores: where they pick differently, match()'s title is at
+    # least as close once both are normalized
+    _, similarity = model
+    title_index = similarity['title_index']
+    titles = list(title_index.titles)
+
+    def closeness(query, title):
+        return difflib.SequenceMatcher(None, normalize_title(title), normalize_title(query)).ratio()
+
+    differences = 0
+    for query in typo_queries:
+        expected = difflib.get_close_matches(query, titles, n=1, cutoff=0.6)
+        matched = [titles[row] for row, _ in title_index.match(query)]
+        if matched != expected:
+            differences += 1
+            assert matched, query
+            assert not expected or closeness(query, matched[0]) >= closeness(query, expected[0]), query
+    assert differences < len(typo_queries) / 10
@@ -0,0 +1,376 @@
+import bisect
+import difflib
+import heapq
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Titles rescored with SequenceMatcher per query, picked by trigram overlap.
+# Titles of one franchise share most of their trigrams, so the pool has to
+# be well above the handful of good answers; most are turned away by
+# difflib's cheap bounds.
+MAX_CANDIDATES = 200
+# Typed titles remembered with the row they resolved to
+RESOLUTION_CACHE_SIZE = int(os.environ.get('CINEMATCH_RESOLUTION_CACHE_SIZE', 10000))
+# Most completions one prefix lookup returns
+MAX_COMPLETIONS = 20
+# Prefixes matching more titles than this (the first keystrokes, common
+# words) have their completions ranked once up front; any other prefix
+# ranks at most this many titles per lookup
+PRECOMPUTED_PREFIX_TITLES = 1000
+# Sorts after every character, closing a bisect range of prefixed keys
+LAST_CHARACTER = chr(0x10FFFF)
+
+def normalize_title(text):
+    # Case, accents and punctuation are ignored when matching titles
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r"[^\w\s]|_", ' ', text.lower()).split())
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def trigram_codes(normalized):
+    # The trigrams as sorted int64 codes, 21 bits per character, so they can
+    # be looked up in a saved array instead of a dict of strings
+    return np.array(sorted(
+        (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2]) for gram in trigrams(normalized)
+    ), dtype=np.int64)
+
+class StringTable:
+    # Strings in one UTF-8 buffer plus where each one starts and ends. A
+    # saved table is memory-mapped, so every process serving the artifact
+    # reads the same pages; items are decoded when they are read.
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self._buffer = memoryview(data)
+        self._bounds = memoryview(offsets)
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(string).encode() for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self._bounds) - 1
+
+    def __getitem__(self, index):
+        return str(self._buffer[self._bounds[index]:self._bounds[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        buffer = self.data.tobytes()
+        bounds = self._bounds.tolist()
+        return (buffer[start:end].decode() for start, end in zip(bounds[:-1], bounds[1:]))
+
+    def take(self, rows):
+        return [self[row] for row in rows]
+
+    def save(self, directory, name):
+        np.save(os.path.join(directory, f"{name}_data.npy"), self.data)
+        np.save(os.path.join(directory, f"{name}_offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory, name, mmap_mode='r'):
+        return cls(*(
+            np.load(os.path.join(directory, f"{name}_{part}.npy"), mmap_mode=mmap_mode)
+            for part in ('data', 'offsets')
+        ))
+
+class SortedStrings:
+    # The rows of a StringTable in the order of their strings, as a sequence
+    # bisect can search. Equal strings keep their row order.
+
+    def __init__(self, table, order):
+        self.table = table
+        self.order = order
+        self._order = memoryview(order)
+
+    @classmethod
+    def sort(cls, table, strings):
+        # strings: the table's strings already decoded
+        return cls(table, np.array(sorted(range(len(strings)), key=strings.__getitem__), dtype=np.int32))
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        return self.table[self._order[position]]
+
+    def find(self, key):
+        # First row holding exactly key, or None
+        position = bisect.bisect_left(self, key)
+        if position < len(self) and self[position] == key:
+            return self._order[position]
+        return None
+
+class TitleIndex:
+    # Character-trigram inverted index over the catalog titles. A query only
+    # rescores the titles sharing the most trigrams with it, instead of
+    # running difflib against every title. Everything is held in flat arrays,
+    # so load() maps a saved index instead of rebuilding it per process.
+
+    # Saved as {name}.npy next to the two string tables
+    ARRAYS = ('trigram_counts', 'gram_codes', 'gram_starts', 'gram_rows')
+
+    def __init__(self, titles, max_candidates=MAX_CANDIDATES):
+        titles = [str(title) for title in titles]
+        normalized = [normalize_title(title) for title in titles]
+        self.max_candidates = max_candidates
+        self.titles = StringTable.from_strings(titles)
+        self.normalized = StringTable.from_strings(normalized)
+        # Rows by their exact catalog title, and by normalized title
+        self.by_title = SortedStrings.sort(self.titles, titles)
+        self.by_normalized = SortedStrings.sort(self.normalized, normalized)
+
+        # Postings of each trigram code, in row order
+        grams = [trigram_codes(title) for title in normalized]
+        self.trigram_counts = np.array([len(codes) for codes in grams], dtype=np.int32)
+        codes = np.concatenate([np.empty(0, dtype=np.int64)] + grams)
+        rows = np.repeat(np.arange(len(grams), dtype=np.int32), self.trigram_counts)
+        order = np.argsort(codes, kind='stable')
+        self.gram_codes, starts = np.unique(codes[order], return_index=True)
+        self.gram_starts = np.append(starts, len(codes)).astype(np.int64)
+        self.gram_rows = rows[order]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.titles.save(directory, 'titles')
+        self.normalized.save(directory, 'normalized_titles')
+        np.save(os.path.join(directory, "title_order.npy"), self.by_title.order)
+        np.save(os.path.join(directory, "normalized_order.npy"), self.by_normalized.order)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, max_candidates=MAX_CANDIDATES, mmap_mode='r'):
+        def mapped(name):
+            # A plain ndarray over the mapping slices without memmap's overhead
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode).view(np.ndarray)
+
+        index = cls.__new__(cls)
+        index.max_candidates = max_candidates
+        index.titles = StringTable.load(directory, 'titles', mmap_mode)
+        index.normalized = StringTable.load(directory, 'normalized_titles', mmap_mode)
+        index.by_title = SortedStrings(index.titles, mapped('title_order'))
+        index.by_normalized = SortedStrings(index.normalized, mapped('normalized_order'))
+        for name in cls.ARRAYS:
+            setattr(index, name, mapped(name))
+        return index
+
+    def postings(self, codes):
+        # Posting lists of the trigram codes found in the catalog
+        if not len(self.gram_codes):
+            return []
+        positions = np.minimum(np.searchsorted(self.gram_codes, codes), len(self.gram_codes) - 1)
+        found = positions[self.gram_codes[positions] == codes]
+        return [self.gram_rows[self.gram_starts[position]:self.gram_starts[position + 1]] for position in found]
+
+    def candidates(self, normalized):
+        codes = trigram_codes(normalized)
+        postings = self.postings(codes)
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+
+        # Trigrams shared with each title, counted without sorting the postings
+        shared = np.bincount(np.concatenate(postings))
+        rows = np.flatnonzero(shared)
+        shared = shared[rows]
+        # Jaccard overlap of the trigram sets
+        overlap = shared / (len(codes) + self.trigram_counts[rows] - shared)
+        if len(rows) > self.max_candidates:
+            keep = np.argpartition(-overlap, self.max_candidates - 1)[:self.max_candidates]
+            rows, overlap = rows[keep], overlap[keep]
+        return rows[np.argsort(-overlap, kind='stable')]
+
+    def match(self, query, n=1, cutoff=0.6):
+        # Best (row, score) pairs with a difflib ratio of at least cutoff,
+        # best first, like difflib.get_close_matches over normalized titles.
+        if n == 1:
+            row = self.by_title.find(query)
+            if row is not None:
+                return [(row, 1.0)]
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+
+        exact_row = self.by_normalized.find(normalized) if n == 1 else None
+        if exact_row is not None:
+            return [(exact_row, 1.0)]
+
+        # The n best so far, worst first. Once there are n, a title has to
+        # reach the worst of them, and difflib's cheap upper bounds on the
+        # ratio turn most of the remaining candidates away.
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(normalized)
+        best = []
+        for row in self.candidates(normalized):
+            floor = max(cutoff, best[0][0]) if len(best) == n else cutoff
+            matcher.set_seq1(self.normalized[row])
+            if matcher.real_quick_ratio() >= floor and matcher.quick_ratio() >= floor:
+                score = matcher.ratio()
+                if score >= floor:
+                    # Ties go to the larger normalized title, as in difflib,
+                    # then to the larger title
+                    entry = (score, self.normalized[row], self.titles[row], int(row))
+                    if len(best) < n:
+                        heapq.heappush(best, entry)
+                    else:
+                        heapq.heappushpop(best, entry)
+
+        return [(row, score) for score, _, _, row in sorted(best, reverse=True)]
+
+    def suggest(self, query, n=5, cutoff=0.4):
+        # "Did you mean" titles for a query that found no match
+        return [self.titles[row] for row, _ in self.match(query, n=n, cutoff=cutoff)]
+
+class ResolutionCache:
+    # LRU map from normalized typed titles to the row TitleIndex.match()
+    # resolved them to (None when nothing matched). Variations in case,
+    # accents, punctuation and spacing share one entry, and one cache is
+    # shared by every session serving the model.
+
+    def __init__(self, title_index, max_entries=RESOLUTION_CACHE_SIZE):
+        self.title_index = title_index
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def resolve(self, query, cutoff=0.6):
+        # (row or None, whether it came from the cache). An exact catalog
+        # title is looked up before the cache, whose normalized keys can't
+        # tell apart titles that only differ in case or punctuation.
+        row = self.title_index.by_title.find(query)
+        if row is not None:
+            return row, False
+
+        key = (normalize_title(query), cutoff)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key], True
+            self.misses += 1
+
+        match = self.title_index.match(query, n=1, cutoff=cutoff)
+        row = match[0][0] if match else None
+        self._store(key, row)
+        return row, False
+
+    def warm(self, rows, cutoff=0.6):
+        # Seeds the cache with the titles of rows, most important first (say,
+        # by popularity), without counting them as lookups
+        for row in reversed(list(rows)[:self.max_entries]):
+            normalized = self.title_index.normalized[row]
+            if normalized:
+                self._store((normalized, cutoff), self.title_index.by_normalized.find(normalized))
+
+    def _store(self, key, row):
+        with self._lock:
+            self._entries[key] = row
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+class PrefixIndex:
+    # Normalized titles in sorted order, so the titles starting with a prefix
+    # are one bisect range. Completions are the most popular titles in it.
+    # keys is the title index's by_normalized, so both share one sort.
+
+    def __init__(self, keys, popularity, max_completions=MAX_COMPLETIONS):
+        self.keys = keys
+        self.rows = keys.order
+        self.popularity = np.asarray(popularity, dtype=np.float32)[self.rows]
+        precomputed = {}
+
+        # Walks down from the one-character prefixes, stopping wherever the
+        # range gets small enough to rank at lookup time
+        pending = [('', 0, len(self.keys))]
+        while pending:
+            parent, start, end = pending.pop()
+            # Keys equal to the parent itself sort first and have no child
+            start = bisect.bisect_right(self.keys, parent, start, end)
+            while start < end:
+                prefix = self.keys[start][:len(parent) + 1]
+                child_end = bisect.bisect_left(self.keys, prefix + LAST_CHARACTER, start, end)
+                if child_end - start > PRECOMPUTED_PREFIX_TITLES:
+                    precomputed[prefix] = self._most_popular(start, child_end, max_completions)
+                    pending.append((prefix, start, child_end))
+                start = child_end
+
+        # Sorted prefixes with one row of completions each
+        prefixes = sorted(precomputed)
+        self.prefixes = StringTable.from_strings(prefixes)
+        self.completions = np.full((len(prefixes), max_completions), -1, dtype=np.int32)
+        for position, prefix in enumerate(prefixes):
+            self.completions[position, :len(precomputed[prefix])] = precomputed[prefix]
+
+    @property
+    def max_completions(self):
+        return self.completions.shape[1]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.prefixes.save(directory, 'prefixes')
+        np.save(os.path.join(directory, "prefix_completions.npy"), self.completions)
+        np.save(os.path.join(directory, "prefix_popularity.npy"), self.popularity)
+
+    @classmethod
+    def load(cls, directory, keys, mmap_mode='r'):
+        index = cls.__new__(cls)
+        index.keys = keys
+        index.rows = keys.order
+        index.prefixes = StringTable.load(directory, 'prefixes', mmap_mode)
+        index.completions = np.load(os.path.join(directory, "prefix_completions.npy"), mmap_mode=mmap_mode)
+        index.popularity = np.load(os.path.join(directory, "prefix_popularity.npy"), mmap_mode=mmap_mode)
+        return index
+
+    def _most_popular(self, start, end, n):
+        # Rows of the n most popular keys in [start, end), ties in title order
+        scores = self.popularity[start:end]
+        if len(scores) > n:
+            threshold = np.partition(scores, len(scores) - n)[len(scores) - n]
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(len(scores))
+        order = candidates[np.argsort(-scores[candidates], kind='stable')[:n]]
+        return self.rows[start + order]
+
+    def complete(self, query, n=5):
+        # Rows of the most popular titles starting with query, best first.
+        # A trailing space only completes whole words.
+        prefix = normalize_title(query)
+        if not prefix:
+            return []
+        if query[-1:].isspace():
+            prefix += ' '
+        n = min(n, self.max_completions)
+
+        position = bisect.bisect_left(self.prefixes, prefix)
+        if position < len(self.prefixes) and self.prefixes[position] == prefix:
+            completions = self.completions[position, :n]
+            return completions[completions >= 0].tolist()
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + LAST_CHARACTER, start)
+        return self._most_popular(start, end, n).tolist()
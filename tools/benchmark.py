@@ -0,0 +1,243 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metrics import memory_usage
+from engine import (NEIGHBOR_K, ArtifactError, build_model, convert_catalog, get_profile_recommendations,
+                    get_recommendations, load_model, read_catalog, save_model)
+from tools.synth_catalog import generate_catalog
+
+# Build and query benchmarks over synthetic catalogs, written as JSON so two
+# commits can be compared:
+#   python -m tools.benchmark --sizes 5000 50000 --out bench.json
+#   python -m tools.benchmark --sizes 5000 50000 --compare bench.json
+#
+# Every size is built and then queried in fresh processes, so peak RSS is
+# the peak of that stage alone. Generated catalogs are kept in --workdir
+# and reused for the same size and seed.
+
+DEFAULT_SIZES = [5000, 50000, 500000]
+# How the build reads the catalog: the whole CSV as it used to, only the
+# model's columns of the CSV, and the columnar copies
+CATALOG_READERS = ['csv_all_columns', 'csv', 'parquet', 'feather']
+QUERIES_PER_STAGE = 500
+PERCENTILES = [50, 95, 99]
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+def latency_summary(samples):
+    millis = np.asarray(samples) * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(millis, p)), 3) for p in PERCENTILES}
+    summary['mean_ms'] = round(float(millis.mean()), 3)
+    summary['count'] = len(samples)
+    return summary
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+def misspell(title, rng):
+    # What a user might type: lowercase, sometimes with one letter dropped
+    typed = title.lower()
+    if len(typed) > 4 and rng.random() < 0.5:
+        cut = rng.randrange(len(typed))
+        typed = typed[:cut] + typed[cut + 1:]
+    return typed
+
+def run_build(catalog_path, model_dir, engine):
+    started = time.perf_counter()
+    movies_data, similarity = build_model(catalog_path, engine)
+    fit_seconds = time.perf_counter() - started
+    manifest = save_model(movies_data, similarity, catalog_path, model_dir)
+    return {
+        'fit_seconds': round(fit_seconds, 3),
+        'seconds': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'num_terms': manifest['num_terms']
+    }
+
+def run_catalog_read(catalog_path, reader):
+    resident_before, _ = memory_usage()
+    started = time.perf_counter()
+    if reader == 'csv_all_columns':
+        movies_data = pd.read_csv(catalog_path)
+    else:
+        movies_data = read_catalog(catalog_path)
+    seconds = time.perf_counter() - started
+    resident_after, _ = memory_usage()
+    return {
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': round((resident_after - resident_before) / (1 << 20), 1) if resident_before else None,
+        'frame_mb': round(movies_data.memory_usage(deep=True).sum() / (1 << 20), 1),
+        'file_mb': round(os.path.getsize(catalog_path) / (1 << 20), 1)
+    }
+
+def benchmark_catalog_reads(catalog_path):
+    results = {}
+    stem = os.path.splitext(catalog_path)[0]
+    for reader in CATALOG_READERS:
+        path = catalog_path
+        if reader in ('parquet', 'feather'):
+            path = f"{stem}.{reader}"
+            try:
+                if not os.path.exists(path):
+                    convert_catalog(catalog_path, path)
+            except ArtifactError as e:
+                results[reader] = {'skipped': str(e)}
+                continue
+        results[reader] = in_fresh_process(run_catalog_read, path, reader)
+    return results
+
+def run_queries(catalog_path, model_dir, queries, seed):
+    started = time.perf_counter()
+    movies_data, similarity = load_model(model_dir, catalog_path)
+    load_seconds = time.perf_counter() - started
+    rss_after_load = peak_rss_mb()
+
+    rng = random.Random(seed)
+    titles = movies_data['title'].tolist()
+    typed = [misspell(titles[rng.randrange(len(titles))], rng) for _ in range(queries)]
+    rows = [rng.randrange(len(titles)) for _ in range(queries)]
+    profiles = [
+        ([titles[rng.randrange(len(titles))] for _ in range(3)], [titles[rng.randrange(len(titles))]])
+        for _ in range(max(1, queries // 5))
+    ]
+    title_index = similarity['title_index']
+
+    stages = {
+        'title_match': timed(lambda name: title_index.match(name, n=1, cutoff=0.6), [(name,) for name in typed]),
+        'recommend_indexed': timed(
+            lambda name: get_recommendations(name, movies_data, similarity, 10),
+            [(titles[row],) for row in rows]
+        ),
+        'recommend_typed': timed(
+            lambda name: get_recommendations(name, movies_data, similarity, 10), [(name,) for name in typed]
+        ),
+        # Longer than the neighbor index, so scored against the whole catalog
+        'recommend_uncached': timed(
+            lambda name: get_recommendations(name, movies_data, similarity, NEIGHBOR_K + 10),
+            [(titles[row],) for row in rows]
+        ),
+        'recommend_profile': timed(
+            lambda liked, disliked: get_profile_recommendations(liked, disliked, movies_data, similarity, 10),
+            profiles
+        )
+    }
+    return {
+        'load_seconds': round(load_seconds, 3),
+        'rss_after_load_mb': rss_after_load,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages
+    }
+
+def in_fresh_process(fn, *args):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(fn, *args).result()
+
+def benchmark_size(num_movies, workdir, engine, queries, seed):
+    catalog_path = os.path.join(workdir, f"catalog_{num_movies}_{seed}.csv")
+    model_dir = os.path.join(workdir, f"model_{num_movies}_{seed}_{engine}")
+    result = {'rows': num_movies, 'engine': engine, 'seed': seed}
+
+    if not os.path.exists(catalog_path):
+        started = time.perf_counter()
+        generate_catalog(num_movies, seed).to_csv(catalog_path, index=False)
+        result['generate_seconds'] = round(time.perf_counter() - started, 3)
+
+    result['catalog_read'] = benchmark_catalog_reads(catalog_path)
+    result['build'] = in_fresh_process(run_build, catalog_path, model_dir, engine)
+    result['query'] = in_fresh_process(run_queries, catalog_path, model_dir, queries, seed)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    # One line per (rows, metric) found in both reports; positive change is slower
+    lines = []
+    before = {(result['rows'], result['engine']): result for result in baseline['results']}
+    for result in report['results']:
+        old = before.get((result['rows'], result['engine']))
+        if old is None:
+            continue
+        metrics = [('build seconds', result['build']['seconds'], old['build']['seconds']),
+                   ('build peak RSS MB', result['build']['peak_rss_mb'], old['build']['peak_rss_mb']),
+                   ('load seconds', result['query']['load_seconds'], old['query']['load_seconds'])]
+        for reader, summary in result.get('catalog_read', {}).items():
+            if 'seconds' in summary and 'seconds' in old.get('catalog_read', {}).get(reader, {}):
+                metrics.append((f"read {reader} seconds", summary['seconds'], old['catalog_read'][reader]['seconds']))
+        for stage, summary in result['query']['stages'].items():
+            if stage in old['query']['stages']:
+                metrics.append((f"{stage} p95 ms", summary['p95_ms'], old['query']['stages'][stage]['p95_ms']))
+        for name, new_value, old_value in metrics:
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            lines.append(f"{result['rows']:>8} {name:<32} {old_value:>10} -> {new_value:>10}  {change:+.1%}")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model build and queries on synthetic catalogs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--engine', choices=['exact', 'ann'], default='exact')
+    parser.add_argument('--queries', type=int, default=QUERIES_PER_STAGE, help="timed calls per stage")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join('.cache', 'benchmark'))
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        'commit': git_commit(),
+        'started_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': []
+    }
+    for num_movies in args.sizes:
+        print(f"Benchmarking {num_movies} movies ({args.engine})...", file=sys.stderr)
+        report['results'].append(benchmark_size(num_movies, args.workdir, args.engine, args.queries, args.seed))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline.get('commit')}:", file=sys.stderr)
+        for line in compare(report, baseline):
+            print(line, file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
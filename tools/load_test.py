@@ -0,0 +1,319 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import metrics
+from engine import CATALOG_PATH, MODEL_DIR, read_catalog
+from facets import split_genres
+from tools.benchmark import latency_summary, misspell
+from tools.tmdb_stub import start_stub
+
+# How many people one CineMatch process can serve at once before latency
+# falls apart:
+#   python -m tools.load_test --sessions 1 4 16 64 --duration 30 --tmdb-latency 0.15
+# Run it from the app folder once the model is built. Every simulated session
+# is a thread, like a Streamlit script run, and loops over searches with
+# --think seconds between them. A search does what main() does for one click:
+# match and rank, then the whole poster grid through the shared poster pool,
+# answered by a local TMDB stub (see tools/tmdb_stub.py) whose latency and
+# failures are set with the --tmdb-* options. Posters go to a throwaway
+# cache, fresh for every concurrency level, so each level starts cold.
+#
+# With --service URL the same query mix is sent to a running service.py
+# instead; its poster-free answers measure ranking under load alone.
+#
+# Each concurrency level reports throughput, latency percentiles and error
+# rates per query kind, as JSON.
+
+DEFAULT_SESSIONS = [1, 4, 16]
+DEFAULT_MIX = "title=5,typo=3,profile=1,filtered=1"
+# A level meets the SLO when its p95 search takes at most this long and no
+# search failed; the report names the most sessions that did
+DEFAULT_SLO_MS = 2000
+PERCENTILE_KEY = 'p95_ms'
+QUERY_KINDS = ['title', 'typo', 'profile', 'filtered', 'weighted']
+# How a search ended; 'not_found' is a typed title nothing matched
+OUTCOMES = ['ok', 'not_found', 'error']
+
+def parse_mix(text):
+    # "title=5,typo=3" -> {'title': 5.0, 'typo': 3.0}; raises ValueError
+    mix = {}
+    for part in text.split(','):
+        kind, _, share = part.partition('=')
+        kind = kind.strip()
+        if kind not in QUERY_KINDS:
+            raise ValueError(f"Unknown query kind '{kind}', use one of {', '.join(QUERY_KINDS)}")
+        try:
+            mix[kind] = float(share)
+        except ValueError:
+            raise ValueError(f"Share of '{kind}' must be a number")
+        if mix[kind] < 0:
+            raise ValueError(f"Share of '{kind}' must not be negative")
+    if not sum(mix.values()):
+        raise ValueError("The query mix is empty")
+    return mix
+
+def make_query(kind, titles, genres, rng):
+    # One search of the given kind, as (liked, disliked, weights, filters)
+    title = titles[rng.randrange(len(titles))]
+    if kind == 'typo':
+        return [misspell(title, rng)], [], None, None
+    if kind == 'profile':
+        liked = [titles[rng.randrange(len(titles))] for _ in range(3)]
+        return liked, [titles[rng.randrange(len(titles))]], None, None
+    if kind == 'filtered':
+        return [title], [], None, {'genres': [rng.choice(genres)]}
+    if kind == 'weighted':
+        return [title], [], {'director': 2.0}, None
+    return [title], [], None, None
+
+class AppClient:
+    # Calls the recommendation entry points in this process, then fetches
+    # the posters the way the results grid does
+
+    def __init__(self, model_dir, catalog_path, num_recommendations):
+        from engine import load_model
+
+        self.movies_data, self.similarity = load_model(model_dir, catalog_path)
+        self.num_recommendations = num_recommendations
+        self.poster_cache = None
+
+    def reset(self, directory):
+        from posters import PosterCache
+
+        self.poster_cache = PosterCache(os.path.join(directory, "posters.sqlite3"))
+
+    def search(self, liked, disliked, weights, filters):
+        # (outcome, rank seconds). Calls the entry points under
+        # get_recommendations() and get_profile_recommendations(), which turn
+        # failures into messages, so errors still raise here.
+        from engine import match_title, recommend, recommend_for_profile
+        from posters import fetch_posters
+
+        started = time.perf_counter()
+        rows = [match_title(self.similarity, name) for name in liked + disliked]
+        if None in rows:
+            return 'not_found', time.perf_counter() - started
+        liked_rows = list(dict.fromkeys(rows[:len(liked)]))
+        disliked_rows = [row for row in dict.fromkeys(rows[len(liked):]) if row not in liked_rows]
+        if len(liked) == 1 and not disliked:
+            recommendations = recommend(
+                self.movies_data, self.similarity, liked_rows[0], self.num_recommendations, weights, filters
+            )
+        else:
+            recommendations = recommend_for_profile(
+                self.movies_data, self.similarity, liked_rows, disliked_rows, self.num_recommendations,
+                weights=weights, filters=filters
+            )
+        rank_seconds = time.perf_counter() - started
+        fetch_posters([rec['title'] for rec in recommendations], self.poster_cache)
+        return 'ok', rank_seconds
+
+class ServiceClient:
+    # Sends the searches to a running service.py; one connection per session
+
+    def __init__(self, base_url, num_recommendations):
+        self.base_url = base_url.rstrip('/')
+        self.num_recommendations = num_recommendations
+        self._local = threading.local()
+
+    def reset(self, directory):
+        pass
+
+    def search(self, liked, disliked, weights, filters):
+        import requests
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        params = [('k', self.num_recommendations)]
+        if weights:
+            params.append(('weights', ",".join(f"{field}={weight}" for field, weight in weights.items())))
+        for genre in (filters or {}).get('genres', []):
+            params.append(('genre', genre))
+        if len(liked) == 1 and not disliked:
+            route, params = "/recommend", params + [('title', liked[0])]
+        else:
+            route = "/recommend/profile"
+            params += [('liked', title) for title in liked] + [('disliked', title) for title in disliked]
+
+        started = time.perf_counter()
+        try:
+            response = session.get(self.base_url + route, params=params, timeout=30)
+        except requests.RequestException:
+            return 'error', time.perf_counter() - started
+        outcome = {200: 'ok', 404: 'not_found'}.get(response.status_code, 'error')
+        return outcome, time.perf_counter() - started
+
+def run_session(client, mix, titles, genres, seed, think, stop_at, results):
+    rng = random.Random(seed)
+    kinds, shares = list(mix), list(mix.values())
+    while time.perf_counter() < stop_at:
+        kind = rng.choices(kinds, shares)[0]
+        query = make_query(kind, titles, genres, rng)
+        started = time.perf_counter()
+        try:
+            outcome, rank_seconds = client.search(*query)
+        except Exception:
+            outcome, rank_seconds = 'error', None
+        results.append((kind, outcome, time.perf_counter() - started, rank_seconds))
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+
+def summarize(results, elapsed):
+    # Throughput, error rate and latency, overall and per query kind
+    groups = {'all': results}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+    summary = {}
+    for kind, group in groups.items():
+        ranked = [rank for _, _, _, rank in group if rank is not None]
+        outcomes = {outcome: 0 for outcome in OUTCOMES}
+        for _, outcome, _, _ in group:
+            outcomes[outcome] += 1
+        summary[kind] = {
+            'searches': len(group),
+            'per_second': round(len(group) / elapsed, 2),
+            'outcomes': outcomes,
+            'errors': outcomes['error'],
+            'error_rate': round(outcomes['error'] / len(group), 4),
+            'latency': dict(latency_summary([seconds for _, _, seconds, _ in group]),
+                            max_ms=round(max(seconds for _, _, seconds, _ in group) * 1000, 3)),
+            'rank_latency': latency_summary(ranked) if ranked else None
+        }
+    return summary
+
+def poster_counters():
+    # Poster lookups and TMDB responses during one level, from the metrics
+    # the app exports anyway
+    return {
+        'lookups': {dict(labels)['outcome']: value
+                    for labels, value in metrics.REGISTRY.counters('cinematch_poster_lookups_total').items()},
+        'tmdb_responses': {dict(labels)['status']: value
+                           for labels, value in metrics.REGISTRY.counters('cinematch_tmdb_responses_total').items()},
+        'deadline_misses': sum(metrics.REGISTRY.counters('cinematch_poster_deadline_misses_total').values())
+    }
+
+def run_level(client, sessions, mix, titles, genres, duration, think, seed):
+    with tempfile.TemporaryDirectory(prefix="load_test_") as directory:
+        client.reset(directory)
+        metrics.REGISTRY.reset()
+        results = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=run_session,
+                args=(client, mix, titles, genres, seed + i, think, started + duration, results),
+                name=f"session-{i}", daemon=True
+            )
+            for i in range(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Sessions finish the search they are in, so a level runs a bit
+        # past its duration
+        elapsed = time.perf_counter() - started
+        level = {'sessions': sessions, 'seconds': round(elapsed, 2), 'results': summarize(results, elapsed)}
+        if isinstance(client, AppClient):
+            level['posters'] = poster_counters()
+        return level
+
+def max_sessions_within(levels, slo_ms):
+    # Most sessions of any level whose p95 search met the SLO without errors
+    passing = [
+        level['sessions'] for level in levels
+        if level['results']['all']['latency'][PERCENTILE_KEY] <= slo_ms and not level['results']['all']['errors']
+    ]
+    return max(passing, default=None)
+
+def print_level(level):
+    overall = level['results']['all']
+    latency = overall['latency']
+    print(f"{level['sessions']:>4} sessions: {overall['per_second']:>8.2f} searches/s  "
+          f"p50 {latency['p50_ms']:>9.1f}ms  p95 {latency['p95_ms']:>9.1f}ms  p99 {latency['p99_ms']:>9.1f}ms  "
+          f"errors {overall['error_rate']:.2%}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test one CineMatch process with concurrent sessions.")
+    parser.add_argument('--sessions', type=int, nargs='+', default=DEFAULT_SESSIONS,
+                        help="concurrent sessions, one level per value")
+    parser.add_argument('--duration', type=float, default=20, help="seconds per level")
+    parser.add_argument('--think', type=float, default=0.0, help="mean seconds a session waits between searches")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"query kinds and their shares, of {', '.join(QUERY_KINDS)}")
+    parser.add_argument('-k', '--num-recommendations', type=int, default=10)
+    parser.add_argument('--model', default=MODEL_DIR)
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    parser.add_argument('--service', help="base URL of a running service.py to load instead of the app code")
+    parser.add_argument('--tmdb-latency', type=float, default=0.1, help="seconds the TMDB stub adds to every response")
+    parser.add_argument('--tmdb-jitter', type=float, default=0.05, help="extra random stub delay, up to this many seconds")
+    parser.add_argument('--tmdb-error-rate', type=float, default=0.0, help="share of stub responses that are HTTP 500")
+    parser.add_argument('--tmdb-rate-limit', type=int, default=0, help="stub requests per second before answering 429")
+    parser.add_argument('--slo-ms', type=float, default=DEFAULT_SLO_MS, help="p95 search latency a level must meet")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.duration <= 0 or min(args.sessions) < 1:
+        parser.error("--duration and --sessions must be positive")
+    # Failed poster lookups are counted in the report rather than logged
+    logging.basicConfig(level=logging.ERROR)
+
+    catalog = read_catalog(args.catalog, columns=['title', 'genres'])
+    titles = catalog['title'].astype(str).tolist()
+    genres = sorted(set().union(*(split_genres(text) for text in catalog['genres'].astype('category').cat.categories)))
+
+    stub = None
+    if args.service:
+        client = ServiceClient(args.service, args.num_recommendations)
+    else:
+        stub = start_stub(latency=args.tmdb_latency, jitter=args.tmdb_jitter, error_rate=args.tmdb_error_rate,
+                          rate_limit=args.tmdb_rate_limit)
+        # Read by posters.py when it is first imported
+        os.environ['TMDB_SEARCH_URL'] = stub.search_url
+        os.environ['TMDB_IMAGE_URL'] = stub.image_url
+        client = AppClient(args.model, args.catalog, args.num_recommendations)
+
+    report = {
+        'target': args.service or 'app',
+        'mix': mix,
+        'think_seconds': args.think,
+        'num_recommendations': args.num_recommendations,
+        'tmdb_stub': None if stub is None else {
+            'latency': args.tmdb_latency, 'jitter': args.tmdb_jitter,
+            'error_rate': args.tmdb_error_rate, 'rate_limit': args.tmdb_rate_limit
+        },
+        'cpu_count': os.cpu_count(),
+        'levels': []
+    }
+    try:
+        for sessions in args.sessions:
+            level = run_level(client, sessions, mix, titles, genres, args.duration, args.think, args.seed)
+            report['levels'].append(level)
+            print_level(level)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+    report['slo_ms'] = args.slo_ms
+    report['max_sessions_within_slo'] = max_sessions_within(report['levels'], args.slo_ms)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from metrics import memory_usage
+
+# Memory of several app replicas on one host, all serving the same model:
+#   python -m tools.replica_memory --replicas 4
+# Run it from the app folder once the model is built. Every replica is a
+# fresh process that loads the model the way the app does and answers a mix
+# of queries; once all of them are up, each reports its resident memory.
+# PSS (Linux only) splits every shared page between the processes mapping
+# it, so the PSS total is what the replicas really cost the host.
+
+QUERIES = 200
+
+def smaps_rollup():
+    # {field: bytes} from /proc/self/smaps_rollup, empty where unavailable
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        pass
+    return fields
+
+def megabytes(value):
+    return round(value / (1 << 20), 1) if value is not None else None
+
+def run_replica(model_dir, catalog_path, queries, seed, barrier, results):
+    from engine import complete_title, get_profile_recommendations, get_recommendations, load_model
+
+    imported, _ = memory_usage()
+    started = time.perf_counter()
+    movies_data, similarity = load_model(model_dir, catalog_path)
+    load_seconds = time.perf_counter() - started
+    loaded, _ = memory_usage()
+
+    rng = random.Random(seed)
+    titles = [movies_data['title'].iloc[rng.randrange(len(movies_data))] for _ in range(queries)]
+    for title in titles:
+        get_recommendations(title.lower()[:-1] if rng.random() < 0.3 else title, movies_data, similarity, 10)
+        complete_title(similarity, title[:rng.randint(1, 6)])
+    get_profile_recommendations(titles[:3], titles[3:4], movies_data, similarity, 10)
+
+    # Measured only once every replica has loaded, so shared pages are
+    # split between all of them
+    barrier.wait()
+    resident, _ = memory_usage()
+    rollup = smaps_rollup()
+    results.put({
+        'load_seconds': round(load_seconds, 3),
+        'imports_rss_mb': megabytes(imported),
+        'loaded_rss_mb': megabytes(loaded),
+        'rss_mb': megabytes(resident),
+        'pss_mb': megabytes(rollup.get('Pss')),
+        'shared_mb': megabytes(rollup.get('Shared_Clean', 0) + rollup.get('Shared_Dirty', 0)) if rollup else None,
+        'private_mb': megabytes(rollup.get('Private_Clean', 0) + rollup.get('Private_Dirty', 0)) if rollup else None
+    })
+    barrier.wait()
+
+def measure(replicas, model_dir, catalog_path, queries=QUERIES, seed=0):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(replicas)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_replica, args=(model_dir, catalog_path, queries, seed + i, barrier, results))
+        for i in range(replicas)
+    ]
+    for process in processes:
+        process.start()
+    report = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    totals = {
+        key: round(sum(replica[key] for replica in report), 1)
+        for key in ('rss_mb', 'pss_mb', 'private_mb') if all(replica[key] is not None for replica in report)
+    }
+    return {'replicas': report, 'totals': totals}
+
+def main(argv=None):
+    from engine import CATALOG_PATH, MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Measure the memory of several replicas serving one model.")
+    parser.add_argument('--replicas', type=int, default=4)
+    parser.add_argument('--model', default=MODEL_DIR)
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    parser.add_argument('--queries', type=int, default=QUERIES, help="queries per replica before measuring")
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = measure(args.replicas, args.model, args.catalog, args.queries)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from tools.benchmark import in_fresh_process, latency_summary
+
+# Cold start and per-rerun cost of the Streamlit app, as JSON:
+#   python -m tools.startup_bench --reruns 20
+# Run it from the app folder once the model is built. Each measurement runs
+# in a fresh interpreter so nothing is already imported or cached.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recommender.py")
+
+IMPORT_PROBE = """
+import sys, time
+started = time.perf_counter()
+import engine, metrics, posters
+app_modules = time.perf_counter() - started
+import streamlit
+print(app_modules, time.perf_counter() - started, 'sklearn' in sys.modules)
+"""
+
+def measure_imports():
+    # What recommender.py imports before drawing anything
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(APP_PATH)
+    ).stdout.split()
+    return {
+        'app_modules_seconds': round(float(output[0]), 3),
+        'with_streamlit_seconds': round(float(output[1]), 3),
+        'imports_sklearn': output[2] == 'True'
+    }
+
+def run_app(reruns, static_serving):
+    from streamlit import config
+    from streamlit.testing.v1 import AppTest
+
+    config.set_option('server.enableStaticServing', static_serving)
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(f"App failed: {app.exception[0].value}")
+
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    return {
+        'static_serving': static_serving,
+        'first_run_seconds': round(first_run, 3),
+        'rerun': latency_summary(samples),
+        # Markdown shipped to the browser on every run, CSS and banner included
+        'markdown_kb_per_run': round(sum(len(block.value) for block in app.markdown) / 1024, 1)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the Streamlit app's cold start and rerun cost.")
+    parser.add_argument('--reruns', type=int, default=20)
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        'imports': measure_imports(),
+        'app': [in_fresh_process(run_app, args.reruns, static_serving) for static_serving in (True, False)]
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
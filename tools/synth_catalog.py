@@ -0,0 +1,108 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Synthetic movie catalogs in the movies_preprocessed.csv layout, for
+# benchmarks and load tests at sizes the real dataset doesn't reach:
+#   python -m tools.synth_catalog --rows 50000 --out movies_50k.csv
+#
+# Movies are drawn around "themes" (think franchises or subgenres) that
+# share genres, keywords and people, on top of Zipf-distributed global
+# vocabularies, so neighbor lists have the clustered shape real metadata
+# gives rather than uniform noise.
+
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Science Fiction',
+    'TV Movie', 'Thriller', 'War', 'Western'
+]
+LANGUAGES = ['en', 'fr', 'es', 'ja', 'de', 'it', 'ko', 'hi', 'zh', 'ru']
+LANGUAGE_WEIGHTS = [0.62, 0.07, 0.06, 0.05, 0.04, 0.04, 0.03, 0.03, 0.03, 0.03]
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ra', 've', 'to', 'sa', 'ne', 'du', 'pi', 'gor', 'lan', 'tes', 'ric',
+    'mon', 'bel', 'zor', 'fin', 'dal', 'quo', 'ar', 'en', 'is', 'ul', 'bra', 'chi', 'der', 'sol'
+]
+
+# Movies per theme, and the share of a movie's keywords / people drawn from
+# its theme rather than the global vocabularies
+MOVIES_PER_THEME = 100
+THEME_KEYWORD_SHARE = 0.6
+THEME_PEOPLE_SHARE = 0.5
+
+def make_words(rng, count, min_syllables=2, max_syllables=4):
+    # count distinct pronounceable words
+    words = set()
+    while len(words) < count:
+        lengths = rng.integers(min_syllables, max_syllables + 1, count)
+        picks = rng.integers(0, len(SYLLABLES), (count, max_syllables))
+        words.update(''.join(SYLLABLES[p] for p in row[:n]) for row, n in zip(picks, lengths))
+    return rng.permutation(np.array(sorted(words)[:count]))
+
+def zipf_indices(rng, size, count, exponent=1.3):
+    return np.minimum(rng.zipf(exponent, count) - 1, size - 1)
+
+def generate_catalog(num_movies, seed=0):
+    rng = np.random.default_rng(seed)
+    keywords = make_words(rng, max(2000, num_movies // 10))
+    first_names = np.char.capitalize(make_words(rng, 2000, 2, 3))
+    surnames = np.char.capitalize(make_words(rng, max(1000, num_movies // 20), 2, 4))
+    num_people = max(5000, num_movies // 2)
+    person_names = np.char.add(
+        np.char.add(first_names[rng.integers(0, len(first_names), num_people)], ' '),
+        surnames[rng.integers(0, len(surnames), num_people)]
+    )
+    title_words = np.char.capitalize(make_words(rng, max(3000, num_movies // 20)))
+
+    num_themes = max(10, num_movies // MOVIES_PER_THEME)
+    theme_genres = [rng.choice(len(GENRES), 3, replace=False) for _ in range(num_themes)]
+    theme_keywords = rng.integers(0, len(keywords), (num_themes, 40))
+    theme_people = rng.integers(0, num_people, (num_themes, 30))
+
+    def mixed(theme_pool, size, count, share):
+        from_theme = rng.random(count) < share
+        return np.where(from_theme, theme_pool[rng.integers(0, len(theme_pool), count)],
+                        zipf_indices(rng, size, count))
+
+    themes = rng.integers(0, num_themes, num_movies)
+    years = np.clip(np.round(rng.normal(2000, 18, num_movies)), 1915, 2025).astype(int)
+    rows = []
+    for theme, year in zip(themes, years):
+        genres = [GENRES[g] for g in rng.choice(theme_genres[theme], rng.integers(1, 4), replace=False)]
+        movie_keywords = keywords[mixed(theme_keywords[theme], len(keywords), rng.integers(3, 9), THEME_KEYWORD_SHARE)]
+        cast = person_names[mixed(theme_people[theme], num_people, 5, THEME_PEOPLE_SHARE)]
+        director = person_names[mixed(theme_people[theme][:5], num_people, 1, THEME_PEOPLE_SHARE)[0]]
+        tagline = None
+        if rng.random() < 0.6:
+            tagline = ' '.join(keywords[mixed(theme_keywords[theme], len(keywords), 4, 0.5)]).capitalize() + '.'
+        title = ' '.join(title_words[zipf_indices(rng, len(title_words), rng.integers(1, 4), 1.1)])
+        rows.append((
+            title, ' '.join(genres), ' '.join(movie_keywords), tagline, ' '.join(cast), director,
+            f"{year}-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}"
+        ))
+
+    movies = pd.DataFrame(rows, columns=['title', 'genres', 'keywords', 'tagline', 'cast', 'director', 'release_date'])
+    movies['popularity'] = np.round(rng.pareto(1.5, num_movies) * 10, 3)
+    movies['original_language'] = rng.choice(LANGUAGES, num_movies, p=LANGUAGE_WEIGHTS)
+    movies['overview'] = movies['tagline'].fillna('') + ' ' + movies['keywords']
+
+    # Titles are unique in the real catalog (data_process.ipynb drops
+    # duplicates); repeats get their year, then a sequel number
+    duplicate = movies['title'].duplicated(keep=False)
+    movies.loc[duplicate, 'title'] += ' (' + years[duplicate.to_numpy()].astype(str) + ')'
+    repeat = movies.groupby('title').cumcount()
+    movies.loc[repeat > 0, 'title'] += ' ' + (repeat[repeat > 0] + 1).astype(str)
+    return movies
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic movie catalog CSV.")
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generate_catalog(args.rows, args.seed).to_csv(args.out, index=False)
+    print(f"Wrote {args.rows} movies to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the TMDB search API and image server, for exercising
+# the poster code without the network. Point the app (or prefetch.py) at it
+# with
+#   TMDB_SEARCH_URL=http://127.0.0.1:<port>/3/search/movie
+#   TMDB_IMAGE_URL=http://127.0.0.1:<port>/t/p/w500
+
+# Size of the posters the image route draws, like TMDB's w500
+POSTER_SIZE = (500, 750)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Like service.py: no delayed-ACK stall between headers and body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        with server.lock:
+            server.requests += 1
+            now = time.monotonic()
+            recent = server.recent
+            while recent and recent[0] <= now - 1:
+                recent.popleft()
+            limited = server.rate_limit and len(recent) >= server.rate_limit
+            if limited:
+                server.limited += 1
+            else:
+                recent.append(now)
+
+        if limited:
+            self.send_json(429, {'status_message': "Request rate limit exceeded"}, {'Retry-After': '1'})
+        elif random.random() < server.error_rate:
+            self.send_json(500, {'status_message': "Injected failure"})
+        elif url.path.startswith('/t/p/') and url.path.endswith('.jpg'):
+            self.send_image(url.path.rsplit('/', 1)[-1][:-len('.jpg')])
+        elif url.path == '/3/search/movie':
+            query = parse_qs(url.query).get('query', [''])[0]
+            digest = hashlib.sha1(query.encode()).hexdigest()
+            # A stable share of titles has no poster, to exercise negative caching
+            if int(digest[:8], 16) / 0xffffffff < server.missing_rate:
+                results = []
+            else:
+                results = [{'title': query, 'poster_path': f"/{digest}.jpg"}]
+            self.send_json(200, {'page': 1, 'results': results})
+        else:
+            self.send_json(404, {'status_message': "Not found"})
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode(), 'application/json', headers)
+
+    def send_image(self, name):
+        # A poster in a colour taken from its name, so every path has its own
+        # image and the same path always gets the same bytes
+        from PIL import Image
+
+        colour = tuple(bytes.fromhex(hashlib.sha1(name.encode()).hexdigest()[:6]))
+        out = io.BytesIO()
+        Image.new('RGB', POSTER_SIZE, colour).save(out, 'JPEG', quality=90)
+        self.send_body(200, out.getvalue(), 'image/jpeg')
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(port=0, latency=0.0, jitter=0.0, error_rate=0.0, missing_rate=0.1, rate_limit=0):
+    # Serves from a daemon thread; returns the server, call shutdown() to stop.
+    # With a rate_limit, requests past that many in the last second get a 429.
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.missing_rate = missing_rate
+    server.rate_limit = rate_limit
+    server.requests = 0
+    server.limited = 0
+    server.recent = deque()
+    server.lock = threading.Lock()
+    server.search_url = f"http://127.0.0.1:{server.server_port}/3/search/movie"
+    server.image_url = f"http://127.0.0.1:{server.server_port}/t/p/w500"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local TMDB stand-in.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with HTTP 500")
+    parser.add_argument('--missing-rate', type=float, default=0.1, help="share of titles without a poster")
+    parser.add_argument('--rate-limit', type=int, default=0, help="requests per second before answering 429")
+    args = parser.parse_args(argv)
+
+    server = start_stub(args.port, args.latency, args.jitter, args.error_rate, args.missing_rate, args.rate_limit)
+    print(f"TMDB stub listening; export TMDB_SEARCH_URL={server.search_url} TMDB_IMAGE_URL={server.image_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()